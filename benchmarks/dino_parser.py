@@ -0,0 +1,66 @@
+"""
+Compare read_dino_ini with the ConfigParser path for DinoExport files.
+
+Every DinoExport in the sample zips under submissions_temp is parsed both
+ways and written out through generate_dino_files; the outputs have to be
+byte-identical before anything is timed.
+
+Run from the repository root:
+    python -m benchmarks.dino_parser
+"""
+
+
+import glob
+import os
+import tempfile
+import zipfile
+from contextlib import redirect_stdout
+from io import StringIO
+from timeit import repeat
+from exts.imports import config_cache, process_files
+from exts.imports.dino_ini import read_dino_ini
+
+
+def load_exports() -> dict:
+    exports = dict()
+    for path in sorted(glob.glob('submissions_temp/*.zip')):
+        with zipfile.ZipFile(path) as z:
+            for info in z.infolist():
+                filename = os.path.basename(info.filename)
+                if 'DinoExport' in filename:
+                    exports[f'{os.path.basename(path)}_{filename}'] = process_files.decode_ini(z.read(info))
+    return exports
+
+
+def parse_configparser(exports):
+    return {filename: process_files.process_file(StringIO(text, newline=None), 'dino.ini')
+            for filename, text in exports.items()}
+
+
+def parse_tokenizer(exports):
+    keep_blocks = config_cache.get_config().keep_blocks['dino.ini']
+    return {filename: read_dino_ini(StringIO(text, newline=None), keep_blocks, filename)
+            for filename, text in exports.items()}
+
+
+def render(dino_data) -> dict:
+    with tempfile.TemporaryDirectory() as directory, redirect_stdout(StringIO()):
+        process_files.generate_dino_files(dino_data, directory)
+        rendered = dict()
+        for filename in dino_data:
+            with open(f'{directory}/{filename}', 'rb') as f:
+                rendered[filename] = f.read()
+    return rendered
+
+
+def main():
+    exports = load_exports()
+    assert render(parse_configparser(exports)) == render(parse_tokenizer(exports))
+    print(f'{len(exports)} DinoExport files, output is byte-identical')
+    for name, func in (('ConfigParser', parse_configparser), ('read_dino_ini', parse_tokenizer)):
+        best = min(repeat(lambda: func(exports), number=5, repeat=5)) / 5
+        print(f'{name:<14} {best * 1000:8.2f}ms  {best / len(exports) * 1000000:6.1f}us/file')
+
+
+if __name__ == '__main__':
+    main()
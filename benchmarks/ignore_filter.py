@@ -0,0 +1,68 @@
+"""
+Compare the old nested-loop Game.ini line filter with the compiled pattern
+from config_cache.
+
+The real Game.ini in submissions_temp is padded with the kind of huge
+ConfigOverrideSupplyCrateItems and OverrideNamedEngramEntries blocks that
+modded servers ship, so the filter has something sizeable to chew on.
+
+Run from the repository root:
+    python -m benchmarks.ignore_filter
+"""
+
+
+from io import StringIO
+from timeit import repeat
+from exts.imports import config_cache
+
+game_ini = 'submissions_temp/Game.ini'
+padding_lines = 20000
+
+
+def build_game_ini() -> str:
+    with open(game_ini) as f:
+        text = f.read()
+    crate = ('ConfigOverrideSupplyCrateItems=(SupplyCrateClassString="SupplyCrate_Level{0}_C",MinItemSets=1,'
+             'MaxItemSets=3,NumItemSetsPower=1.0,bSetsRandomWithoutReplacement=true,ItemSets=((MinNumItems=1,'
+             'MaxNumItems=2,NumItemsPower=1.0,SetWeight=1.0,bItemsRandomWithoutReplacement=true,ItemEntries='
+             '((EntryWeight=1.0,ItemClassStrings=("PrimalItemResource_Element_C"),ItemsWeights=(1.0),'
+             'MinQuantity=10.0,MaxQuantity=20.0,MinQuality=1.0,MaxQuality=1.0,bForceBlueprint=false,'
+             'ChanceToBeBlueprintOverride=0.0)))))\n')
+    engram = 'OverrideNamedEngramEntries=(EngramClassName="EngramEntry_{0}_C",EngramHidden=false,EngramPointsCost=1)\n'
+    stat = 'PerLevelStatsMultiplier_DinoTamed_Add[{0}]=1.000000\n'
+    padding = ''.join((crate, engram, stat)[i % 3].format(i) for i in range(padding_lines))
+    return text + padding
+
+
+def nested_loop(lines, ignore_strings):
+    clean_data = list()
+    for line in lines:
+        ignore = 0
+        for string in ignore_strings:
+            if string.lower() in line.lower():
+                ignore = 1
+        if not ignore:
+            clean_data.append(line)
+    return clean_data
+
+
+def compiled(lines, pattern):
+    search = pattern.search
+    return [line for line in lines if not search(line.lower())]
+
+
+def main():
+    snapshot = config_cache.get_config()
+    ignore_strings = snapshot.config['ignore_strings']['game.ini']
+    pattern = snapshot.ignore_patterns['game.ini']
+    text = build_game_ini()
+    lines = StringIO(text).readlines()
+    assert nested_loop(lines, ignore_strings) == compiled(lines, pattern)
+    print(f'{len(lines)} lines, {len(text) // 1024}KB, {len(ignore_strings)} ignore strings')
+    for name, func, arg in (('nested loop', nested_loop, ignore_strings), ('compiled', compiled, pattern)):
+        best = min(repeat(lambda: func(lines, arg), number=5, repeat=5)) / 5
+        print(f'{name:<12} {best * 1000:8.2f}ms')
+
+
+if __name__ == '__main__':
+    main()
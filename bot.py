@@ -31,27 +31,23 @@ import discord
 from discord.ext import commands
 import logging
 import json
+import os
 import aiohttp
 import asyncio
 import asyncpg
+import multiprocessing
 from concurrent import futures
+from concurrent.futures.process import BrokenProcessPool
 from typing import Dict
 from datetime import datetime
+from exts.imports import dino_db
+from exts.imports.guild_cache import GuildConfigCache
 
 log_format = '{asctime}.{msecs:03.0f}|{levelname:<8}|{name}::{message}'
 date_format = '%Y.%m.%d %H.%M.%S'
 
 log_dir = 'logs'
 
-log_file = '{0}/submitter_{1}.log'.format(log_dir, datetime.now().strftime('%Y%m%d_%H%M%S%f'))
-
-logging.basicConfig(level=logging.DEBUG, style='{', filename=log_file, datefmt=date_format, format=log_format)
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.INFO)
-formatter = logging.Formatter(log_format, style='{', datefmt=date_format)
-console_handler.setFormatter(formatter)
-logging.getLogger('').addHandler(console_handler)
-
 extension_dir = 'exts'
 owner_id = 351794468870946827
 bot_config_file = 'bot_config.json'
@@ -60,8 +56,15 @@ config_dir = 'config/'
 
 description = 'Submission Bot for Ark Smart Breeder'
 
+with open(f'{config_dir}{bot_config_file}') as config_file:
+    # Sharding has to be chosen before the class is built, the rest of the config is loaded in __init__
+    startup_config = json.load(config_file)
+# Set by launcher.py when this process runs part of a cluster
+cluster_shards = os.environ.get('SUBMITTER_SHARD_IDS')
+sharded = startup_config.get('sharded', False) or cluster_shards is not None
+
 
-class Submitter(commands.Bot):
+class Submitter(commands.AutoShardedBot if sharded else commands.Bot):
     def __init__(self, **kwargs):
         kwargs["command_prefix"] = self.get_custom_prefix
         super().__init__(**kwargs)
@@ -70,7 +73,6 @@ class Submitter(commands.Bot):
             self.bot_config = json.load(file)
         with open(f'{config_dir}{secrets_file}') as file:
             self.bot_secrets = json.load(file)
-        self.guild_config = {}
         self.infected = {}
         self.TOKEN = self.bot_secrets['token']
         del self.bot_secrets['token']
@@ -82,8 +84,16 @@ class Submitter(commands.Bot):
                                              password=self.bot_secrets['db_con']['password'],
                                              loop=self.loop)
         self.db_con = asyncio.get_event_loop().run_until_complete(connect_db())
+        try:
+            # Before any extension loads, so the first upload can already COPY into the tables
+            asyncio.get_event_loop().run_until_complete(dino_db.create_tables(self.db_con))
+        except Exception:
+            logging.exception('Could not create the dino tables, uploads will not be stored in the database')
+        self.guild_config = GuildConfigCache(self.db_con)
+        self.guild_config_listener = None
         self.default_prefix = '!'
         self.tpe = futures.ThreadPoolExecutor()
+        self.ppe = self.make_process_pool()
         self.embed_color = discord.Colour.from_rgb(49, 107, 111)
         self.unicode_emojis: Dict[str, str] = {
                                         'x': '❌',
@@ -96,8 +106,48 @@ class Submitter(commands.Bot):
 
     @staticmethod
     async def get_custom_prefix(bot_inst, message):
-        return await bot_inst.db_con.fetchval('select prefix from guild_config where guild_id = $1',
-                                              message.guild.id) or bot_inst.default_prefix
+        if message.guild is None:
+            return bot_inst.default_prefix
+        return (await bot_inst.guild_config.fetch(message.guild.id)).prefix or bot_inst.default_prefix
+
+    def make_process_pool(self):
+        if self.bot_config.get('parse_executor', 'process') != 'process':
+            return self.tpe
+        # Workers are started by a forkserver, not forked from this process. Its gateway heartbeat and
+        # executor threads could be holding a lock at fork time that the worker would then wait on forever.
+        workers = self.bot_config.get('parse_workers') or os.cpu_count() or 1
+        if cluster_shards is not None:
+            # parse_workers is for the whole host, shared out between the cluster processes
+            workers = max(1, workers // int(os.environ.get('SUBMITTER_CLUSTERS', 1)))
+        return futures.ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('forkserver'))
+
+    async def run_in_process(self, func, *args):
+        """Run func in the parse pool, giving up after parse_timeout seconds.
+
+        A pool whose worker died, or hung past the timeout, is replaced so
+        the next upload gets working processes again.
+        """
+        pool = self.ppe
+        try:
+            return await asyncio.wait_for(self.loop.run_in_executor(pool, func, *args),
+                                          self.bot_config.get('parse_timeout', 120.0))
+        except (BrokenProcessPool, asyncio.TimeoutError):
+            if pool is self.ppe and pool is not self.tpe:
+                logging.warning(f'Replacing the parse pool after {func.__name__} failed')
+                self.ppe = self.make_process_pool()
+                # A hung worker never returns, so the old workers are killed instead of waited for
+                workers = list((pool._processes or {}).values())
+                pool.shutdown(wait=False)
+                for worker in workers:
+                    worker.kill()
+            raise
+
+    async def connect_listener(self):
+        return await asyncpg.connect(host=self.bot_secrets['db_con']['host'],
+                                     database=self.bot_secrets['db_con']['db_name'],
+                                     user=self.bot_secrets['db_con']['user'],
+                                     password=self.bot_secrets['db_con']['password'],
+                                     loop=self.loop)
 
     async def load_ext(self, ctx, mod=None):
         self.load_extension('{0}.{1}'.format(extension_dir, mod))
@@ -110,73 +160,94 @@ class Submitter(commands.Bot):
             await ctx.send('{0} unloaded.'.format(mod))
 
     async def close(self):
+        if self.guild_config_listener is not None:
+            self.guild_config_listener.cancel()
         await super().close()
         await self.aio_session.close()
-
-
-bot = Submitter(description=description, case_insensitive=True)
-
-
-@bot.command(hidden=True)
-@commands.is_owner()
-async def load(ctx, mod=None):
-    """Allows the owner to load extensions dynamically"""
-    await bot.load_ext(ctx, mod)
-
-
-@bot.command(hidden=True)
-@commands.is_owner()
-async def reload(ctx, mod=None):
-    """Allows the owner to reload extensions dynamically"""
-    if mod == 'all':
-        load_list = bot.bot_config['load_list']
-        for load_item in load_list:
-            await bot.unload_ext(ctx, f'{load_item}')
-            await bot.load_ext(ctx, f'{load_item}')
+        self.ppe.shutdown(wait=False)
+        self.tpe.shutdown(wait=False)
+
+
+if __name__ == '__main__':
+    # Parse workers import this file as __mp_main__, only the bot process itself logs to a file and connects
+    log_file = '{0}/submitter_{1}.log'.format(log_dir, datetime.now().strftime('%Y%m%d_%H%M%S%f'))
+
+    logging.basicConfig(level=logging.DEBUG, style='{', filename=log_file, datefmt=date_format, format=log_format)
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(logging.INFO)
+    formatter = logging.Formatter(log_format, style='{', datefmt=date_format)
+    console_handler.setFormatter(formatter)
+    logging.getLogger('').addHandler(console_handler)
+
+    if cluster_shards is not None:
+        bot = Submitter(description=description, case_insensitive=True,
+                        shard_ids=[int(shard_id) for shard_id in cluster_shards.split(',')],
+                        shard_count=int(os.environ['SUBMITTER_SHARD_COUNT']))
+    elif sharded:
+        # shard_count None lets Discord pick how many shards to run
+        bot = Submitter(description=description, case_insensitive=True,
+                        shard_count=startup_config.get('shard_count'))
     else:
-        await bot.unload_ext(ctx, mod)
-        await bot.load_ext(ctx, mod)
+        bot = Submitter(description=description, case_insensitive=True)
 
+    @bot.command(hidden=True)
+    @commands.is_owner()
+    async def load(ctx, mod=None):
+        """Allows the owner to load extensions dynamically"""
+        await bot.load_ext(ctx, mod)
 
-@bot.command(hidden=True)
-@commands.is_owner()
-async def unload(ctx, mod):
-    """Allows the owner to unload extensions dynamically"""
-    await bot.unload_ext(ctx, mod)
+    @bot.command(hidden=True)
+    @commands.is_owner()
+    async def reload(ctx, mod=None):
+        """Allows the owner to reload extensions dynamically"""
+        if mod == 'all':
+            load_list = bot.bot_config['load_list']
+            for load_item in load_list:
+                await bot.unload_ext(ctx, f'{load_item}')
+                await bot.load_ext(ctx, f'{load_item}')
+        else:
+            await bot.unload_ext(ctx, mod)
+            await bot.load_ext(ctx, mod)
 
+    @bot.command(hidden=True)
+    @commands.is_owner()
+    async def unload(ctx, mod):
+        """Allows the owner to unload extensions dynamically"""
+        await bot.unload_ext(ctx, mod)
 
-@bot.event
-async def on_message(ctx):
-    if not ctx.author.bot:
-        if ctx.guild:
-            if int(await bot.db_con.fetchval("select channel_lockdown from guild_config where guild_id = $1",
-                                             ctx.guild.id)):
-                if ctx.channel.id in json.loads(await bot.db_con.fetchval("select allowed_channels from guild_config "
-                                                                          "where guild_id = $1",
-                                                                          ctx.guild.id)):
+    @bot.event
+    async def on_message(ctx):
+        if not ctx.author.bot:
+            if ctx.guild:
+                config = await bot.guild_config.fetch(ctx.guild.id)
+                if config.channel_lockdown:
+                    if ctx.channel.id in config.allowed_channels:
+                        await bot.process_commands(ctx)
+                else:
                     await bot.process_commands(ctx)
             else:
                 await bot.process_commands(ctx)
-        else:
-            await bot.process_commands(ctx)
-
-
-@bot.event
-async def on_ready():
-    if bot.db_con is None:
-        await bot.connect_db()
-    bot.recent_msgs = {}
-    logging.info('Logged in as {0.name}|{0.id}'.format(bot.user))
-    load_list = bot.bot_config['load_list']
-    for load_item in load_list:
-        await bot.load_ext(None, f'{load_item}')
-        logging.info('Extension Loaded: {0}'.format(load_item))
-    with open(f'{config_dir}reboot', 'r') as f:
-        reboot = f.readlines()
-    if int(reboot[0]) == 1:
-        await bot.get_channel(int(reboot[1])).send('Restart Finished.')
-    with open(f'{config_dir}reboot', 'w') as f:
-        f.write(f'0')
-    logging.info('Done loading, Submitter is active.')
-
-bot.run(bot.TOKEN)
+
+    @bot.event
+    async def on_ready():
+        if bot.db_con is None:
+            await bot.connect_db()
+        bot.recent_msgs = {}
+        await bot.guild_config.warm()
+        if bot.guild_config_listener is None:
+            bot.guild_config_listener = bot.loop.create_task(bot.guild_config.listen(bot.connect_listener))
+        logging.info('Logged in as {0.name}|{0.id}'.format(bot.user))
+        load_list = bot.bot_config['load_list']
+        for load_item in load_list:
+            await bot.load_ext(None, f'{load_item}')
+            logging.info('Extension Loaded: {0}'.format(load_item))
+        with open(f'{config_dir}reboot', 'r') as f:
+            reboot = f.readlines()
+        # In a cluster only the process that can see the channel answers and clears the flag
+        if int(reboot[0]) == 1 and bot.get_channel(int(reboot[1])) is not None:
+            await bot.get_channel(int(reboot[1])).send('Restart Finished.')
+            with open(f'{config_dir}reboot', 'w') as f:
+                f.write(f'0')
+        logging.info('Done loading, Submitter is active.')
+
+    bot.run(bot.TOKEN)
@@ -29,11 +29,12 @@ WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 import discord
 from discord.ext import commands
-from .imports import checks, utils
+from .imports import checks, config_cache, utils
 import json
 import logging
 import inspect
 import os
+import signal
 
 admin_log = logging.getLogger('admin')
 config_dir = 'config/'
@@ -50,7 +51,11 @@ class Admin:
         await ctx.send('Submitter is restarting.')
         with open(f'{config_dir}reboot', 'w') as f:
             f.write(f'1\n{ctx.channel.id}')
-        os._exit(1)
+        if os.environ.get('SUBMITTER_CLUSTER') is not None:
+            # launcher.py restarts every cluster, this one included, so they all run the new code
+            os.kill(os.getppid(), signal.SIGHUP)
+        else:
+            os._exit(1)
 
     @commands.group(case_insensitive=True)
     async def set(self, ctx):
@@ -92,27 +97,29 @@ class Admin:
     async def reload_bot_config(self, ctx):
         with open(f'{config_dir}{bot_config_file}') as file:
             self.bot.bot_config = json.load(file)
-        del self.bot.bot_config['token']
-        del self.bot.bot_config['db_con']
+        self.bot.bot_config.pop('token', None)
+        self.bot.bot_config.pop('db_con', None)
+        config_cache.invalidate()
         await ctx.send('Config reloaded.')
 
     @set.command(name='channel_lockdown', aliases=['lockdown', 'restrict_access', 'cl'])
     async def _channel_lockdown(self, ctx, config='true'):
         if ctx.guild:
-            if checks.is_admin(self.bot, ctx):
+            if await checks.is_admin(self.bot, ctx):
+                guild_config = await self.bot.guild_config.fetch(ctx.guild.id)
                 if str(config).lower() == 'true':
-                    if await self.bot.db_con.fetchval('select allowed_channels from guild_config '
-                                                      'where guild_id = $1', ctx.guild.id) is []:
+                    if not guild_config.allowed_channels:
                         await ctx.send('Please set at least one allowed channel before running this command.')
                     else:
                         await self.bot.db_con.execute('update guild_config set channel_lockdown = True '
                                                       'where guild_id = $1', ctx.guild.id)
+                        await self.bot.guild_config.publish(ctx.guild.id, channel_lockdown=True)
                         await ctx.send('Channel Lockdown is now active.')
                 elif str(config).lower() == 'false':
-                    if await self.bot.db_con.fetchval('select channel_lockdown from guild_config '
-                                                      'where guild_id = $1', ctx.guild.id):
+                    if guild_config.channel_lockdown:
                         await self.bot.db_con.execute('update guild_config set channel_lockdown = False '
                                                       'where guild_id = $1', ctx.guild.id)
+                        await self.bot.guild_config.publish(ctx.guild.id, channel_lockdown=False)
                         await ctx.send('Channel Lockdown has been deactivated.')
                     else:
                         await ctx.send('Channel Lockdown is already deactivated.')
@@ -124,39 +131,26 @@ class Admin:
     @add.command(name='allowed_channels', aliases=['channel', 'ac'])
     async def _allowed_channels(self, ctx, *, channels):
         if ctx.guild:
-            if checks.is_admin(self.bot, ctx):
+            if await checks.is_admin(self.bot, ctx):
                 channels = channels.lower().replace(' ', '').split(',')
                 added = ''
+                allowed_channels = list((await self.bot.guild_config.fetch(ctx.guild.id)).allowed_channels)
                 for channel in channels:
                     chnl = discord.utils.get(ctx.guild.channels, name=channel)
                     if chnl is None:
                         await ctx.send(f'{channel} is not a valid text channel in this guild.')
+                    elif chnl.id in allowed_channels:
+                        admin_log.info('Chan found in config')
+                        await ctx.send(f'{channel} is already in the list of allowed channels. Skipping...')
                     else:
-                        admin_log.info('Chan found')
-                        if await self.bot.db_con.fetchval('select allowed_channels from guild_config '
-                                                          'where guild_id = $1', ctx.guild.id):
-                            if chnl.id in await  self.bot.con.fetchval('select allowed_channels from guild_config '
-                                                                       'where guild_id = $1',
-                                                                       ctx.guild.id):
-                                admin_log.info('Chan found in config')
-                                await ctx.send(f'{channel} is already in the list of allowed channels. Skipping...')
-                            else:
-                                admin_log.info('Chan not found in config')
-                                allowed_channels = await self.bot.db_con.fetchval('select allowed_channels from '
-                                                                                  'guild_config where guild_id = $1',
-                                                                                  ctx.guild.id).append(chnl.id)
-                                await self.bot.db_con.execute('update guild_config set allowed_channels = $2 '
-                                                              'where guild_id = $1',
-                                                              ctx.guild.id, allowed_channels)
-                                added = f'{added}\n{channel}'
-                        else:
-                            admin_log.info('Chan not found in config')
-                            allowed_channels = [chnl.id]
-                            await self.bot.db_con.execute('update guild_config set allowed_channels = $2 '
-                                                          'where guild_id = $1',
-                                                          ctx.guild.id, allowed_channels)
-                            added = f'{added}\n{channel}'
+                        admin_log.info('Chan not found in config')
+                        allowed_channels.append(chnl.id)
+                        added = f'{added}\n{channel}'
                 if added != '':
+                    await self.bot.db_con.execute('update guild_config set allowed_channels = $2 '
+                                                  'where guild_id = $1',
+                                                  ctx.guild.id, json.dumps(allowed_channels))
+                    await self.bot.guild_config.publish(ctx.guild.id, allowed_channels=allowed_channels)
                     await ctx.send(f'The following channels have been added to the allowed channel list: {added}')
                 await ctx.message.add_reaction('✅')
             else:
@@ -177,14 +171,14 @@ class Admin:
     async def _add_admin_role(self, ctx, role=None):
         role = discord.utils.get(ctx.guild.roles, name=role)
         if role is not None:
-            roles = await self.bot.db_con.fetchval('select admin_roles from guild_config where guild_id = $1',
-                                                   ctx.guild.id)
+            roles = list((await self.bot.guild_config.fetch(ctx.guild.id)).admin_roles)
             if role.id in roles:
                 await ctx.send(f'{role.name} is already registered as an admin role in this guild.')
             else:
                 roles.append(role.id)
                 await self.bot.db_con.execute('update guild_config set admin_roles = $2 where guild_id = $1',
                                               ctx.guild.id, roles)
+                await self.bot.guild_config.publish(ctx.guild.id, admin_roles=roles)
                 await ctx.send(f'{role.name} has been added to the list of admin roles for this guild.')
         else:
             await ctx.send('You must include a valid role name with this command.')
@@ -195,12 +189,12 @@ class Admin:
     async def _remove_admin_role(self, ctx, role=None):
         role = discord.utils.get(ctx.guild.roles, name=role)
         if role is not None:
-            roles = await self.bot.db_con.fetchval('select admin_roles from guild_config where guild_id = $1',
-                                                   ctx.guild.id)
+            roles = list((await self.bot.guild_config.fetch(ctx.guild.id)).admin_roles)
             if role.id in roles:
                 roles.remove(role.id)
                 await self.bot.db_con.execute('update guild_config set admin_roles = $2 where guild_id = $1',
                                               ctx.guild.id, roles)
+                await self.bot.guild_config.publish(ctx.guild.id, admin_roles=roles)
                 await ctx.send(f'{role.name} has been removed from the list of admin roles for this guild.')
             else:
                 await ctx.send(f'{role.name} is not registered as an admin role in this guild.')
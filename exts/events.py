@@ -40,11 +40,14 @@ class BotEvents:
     async def on_guild_join(self, guild):
         await self.bot.db_con.execute("insert into guild_config(guild_id, channel_lockdown, admin_roles) "
                                       "values ($1, $2, $3)", guild.id, False, [guild.role_hierarchy[0].id])
+        await self.bot.guild_config.publish(guild.id, channel_lockdown=False,
+                                            admin_roles=[guild.role_hierarchy[0].id])
         events_log.info(f'Entry Created for {guild.name}')
         await guild.me.edit(nick='[!] Submitter')
 
     async def on_guild_remove(self, guild):
         await self.bot.db_con.execute(f'delete from guild_config where guild_id = $1', guild.id)
+        await self.bot.guild_config.publish(guild.id)
         events_log.info(f'Left the {guild.name} guild.')
 
 
@@ -30,8 +30,8 @@ WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 import discord
 from discord.ext import commands
 import logging
-from .imports.utils import paginate, run_command
-import asyncio
+from .imports.utils import paginate, run_git, command_timings
+import re
 
 git_log = logging.getLogger('git')
 
@@ -53,13 +53,12 @@ class Git:
                                title=f'Git Pull',
                                color=self.bot.embed_color)
             em.set_thumbnail(url=f'{ctx.guild.me.avatar_url}')
-            result = await asyncio.wait_for(self.bot.loop.create_task(run_command('git fetch --all')), 120) + '\n'
-            result += await asyncio.wait_for(self.bot.loop.create_task(run_command('git reset --hard '
-                                                                                   'origin/$(git '
-                                                                                   'rev-parse --symbolic-full-name '
-                                                                                   '--abbrev-ref HEAD)')), 120) + '\n\n'
-            result += await asyncio.wait_for(self.bot.loop.create_task(run_command('git show --stat | '
-                                                                                   'sed "s/.*@.*[.].*/ /g"')), 10)
+            result = str(await run_git(None, 'fetch', '--all')) + '\n'
+            branch = await run_git(None, 'rev-parse', '--symbolic-full-name', '--abbrev-ref', 'HEAD', timeout=10)
+            result += str(await run_git(None, 'reset', '--hard', f'origin/{branch.stdout}')) + '\n\n'
+            show = await run_git(None, 'show', '--stat', timeout=10)
+            # Blank out any lines with an email address in them
+            result += re.sub(r'(?m)^.*@.*[.].*$', ' ', show.stdout)
             results = paginate(result, maxlen=1014)
             for page in results[:5]:
                 em.add_field(name='￲', value=f'{page}')
@@ -72,12 +71,51 @@ class Git:
                            title=f'Git Pull',
                            color=self.bot.embed_color)
         em.set_thumbnail(url=f'{ctx.guild.me.avatar_url}')
-        result = await asyncio.wait_for(self.bot.loop.create_task(run_command('git status')), 10)
-        results = paginate(result, maxlen=1014)
+        result = await run_git(None, 'status', timeout=10)
+        results = paginate(str(result), maxlen=1014)
         for page in results[:5]:
             em.add_field(name='￲', value=f'{page}')
         await ctx.send(embed=em)
 
+    @git.command()
+    @commands.is_owner()
+    async def storage(self, ctx):
+        """Show how up to date the submissions repo is"""
+        uploader = self.bot.get_cog('Uploader')
+        if uploader is None:
+            return await ctx.send('The uploader is not loaded.')
+        sync = uploader.scheduler.sync
+        if sync.fresh_as_of is None:
+            await ctx.send('The submissions repo has not been synced yet.')
+        else:
+            await ctx.send(f'The submissions repo is fresh as of {sync.fresh_as_of.strftime("%Y-%m-%d %H:%M:%S")} UTC.')
+
+    @git.command()
+    @commands.is_owner()
+    async def maintenance(self, ctx, run_now: bool=False):
+        """Show the last maintenance run on the submissions repo, or start one now"""
+        uploader = self.bot.get_cog('Uploader')
+        if uploader is None:
+            return await ctx.send('The uploader is not loaded.')
+        if run_now:
+            async with ctx.typing():
+                report = await uploader.maintenance.run(force=True)
+        else:
+            report = uploader.maintenance.last_report
+        if report is None:
+            return await ctx.send('No maintenance has run yet.')
+        for page in paginate(str(report)):
+            await ctx.send(page)
+
+    @git.command()
+    @commands.is_owner()
+    async def timings(self, ctx):
+        """Show how long the commands run by the bot have been taking"""
+        lines = [f'{name:<20} {count:>6} runs  avg {total / count:7.3f}s  max {worst:7.3f}s'
+                 for name, (count, total, worst) in sorted(command_timings.items())]
+        for page in paginate('\n'.join(lines) or 'No commands have been run yet.'):
+            await ctx.send(page)
+
 
 def setup(bot):
     bot.add_cog(Git(bot))
\ No newline at end of file
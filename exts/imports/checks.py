@@ -27,17 +27,19 @@ WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """
 
 
-import discord
-
 owner_id = 351794468870946827
 
 
 async def is_admin(bot, ctx):
-    admin_roles = await bot.db_con.fetchval("select admin_roles from guild_config where guild_id = $1", ctx.guild.id)
-    for role in admin_roles:
-        if discord.utils.get(ctx.guild.roles, id=admin_roles[role]) in ctx.message.author.roles:
-            return True
-    return ctx.message.author.id == ctx.guild.owner.id or ctx.message.author.id == owner_id
+    """Guild owner, bot owner or anyone holding one of the guild's admin roles.
+
+    The admin roles come from the guild_config cache as a set of ids,
+    which Admin keeps current when roles are added or removed.
+    """
+    if ctx.message.author.id == ctx.guild.owner.id or ctx.message.author.id == owner_id:
+        return True
+    admin_roles = (await bot.guild_config.fetch(ctx.guild.id)).admin_roles
+    return not admin_roles.isdisjoint(role.id for role in ctx.message.author.roles)
 
 
 def is_guild_owner(ctx):
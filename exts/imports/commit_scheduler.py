@@ -0,0 +1,182 @@
+"""
+===
+
+MIT License
+
+Copyright (c) 2018 Dusty.P https://github.com/dustinpianalto
+
+Permission is hereby granted, free of charge, to any person obtaining
+a copy of this software and associated documentation files (the
+"Software"), to deal in the Software without restriction, including
+without limitation the rights to use, copy, modify, merge, publish,
+distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to
+the following conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+
+
+import asyncio
+import logging
+import os
+from . import utils
+from .pipeline import merge_tree
+from .process_lock import FileLock, ProcessLock
+from .repo_sync import RepoSync
+
+commit_log = logging.getLogger('commit_scheduler')
+
+
+class BatchResult:
+    """Outcome of one batched commit, shared by every job in the batch.
+
+    stage is 'done' when the push went through, otherwise the git step
+    that failed ('pull', 'commit' or 'push') with its output in status.
+    A job that can never be committed, because files in its manifest are
+    missing, gets a result of its own with the stage 'invalid'.
+    """
+    def __init__(self, jobs: list, stage: str='done', status: str='Completed'):
+        self.jobs = jobs
+        self.stage = stage
+        self.status = status
+
+    def __repr__(self):
+        return f'<BatchResult jobs={len(self.jobs)} stage={self.stage}>'
+
+
+class CommitScheduler:
+    """Owns the submissions repo and coalesces finished uploads into shared commits.
+
+    Jobs submitted within ``window`` seconds of the first one, up to
+    ``max_batch`` of them, are moved into the repo and go out in a single
+    pull, commit and push. ``lock`` is held for the whole git sequence, it
+    is shared with every bot process on the host through a lock file next
+    to the repo, so only one of them writes to it at a time.
+    The pull is skipped when ``sync`` already has the repo up to date.
+    """
+    def __init__(self, loop, directory: str, window: float=10.0, max_batch: int=25, fetch_interval: float=60.0):
+        self.loop = loop
+        self.directory = directory
+        self.window = window
+        self.max_batch = max_batch
+        self.lock = ProcessLock(f'{os.path.normpath(directory)}.lock')
+        self.pending = list()
+        self._wakeup = asyncio.Event()
+        self._full = asyncio.Event()
+        # Held by the one process that runs the background sync and maintenance
+        self.upkeep = FileLock(f'{os.path.normpath(directory)}.upkeep.lock')
+        self.sync = RepoSync(loop, directory, self.lock, self.upkeep, fetch_interval)
+        self.task = loop.create_task(self._run())
+
+    async def submit(self, job) -> BatchResult:
+        future = self.loop.create_future()
+        self.pending.append((job, future))
+        self._wakeup.set()
+        if len(self.pending) >= self.max_batch:
+            self._full.set()
+        return await future
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            try:
+                await asyncio.wait_for(self._full.wait(), self.window)
+            except asyncio.TimeoutError:
+                pass
+            batch, self.pending = self.pending[:self.max_batch], self.pending[self.max_batch:]
+            self._full.clear()
+            if self.pending:
+                if len(self.pending) >= self.max_batch:
+                    self._full.set()
+            else:
+                self._wakeup.clear()
+            batch = [(job, future) for job, future in batch if not future.done()]
+            if not batch:
+                continue
+            try:
+                async with self.lock:
+                    results = await self._commit([job for job, future in batch])
+            except Exception as e:
+                commit_log.exception(f'Batch of {len(batch)} uploads failed')
+                for job, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                outcome = {id(job): result for result in results for job in result.jobs}
+                for job, future in batch:
+                    if not future.done():
+                        future.set_result(outcome[id(job)])
+
+    def _missing(self, job) -> list:
+        """Manifest paths that are neither in the job's workspace nor already in the repo."""
+        return [path for path in job.manifest
+                if not os.path.exists(os.path.join(job.workspace, path))
+                and not os.path.exists(os.path.join(self.directory, path))]
+
+    async def _commit(self, jobs: list) -> list:
+        # git update-index fails outright on a missing path, so one broken job would fail every batch it joins
+        results = list()
+        valid = list()
+        for job in jobs:
+            missing = self._missing(job)
+            if missing:
+                commit_log.error(f'{job} is missing {len(missing)} files from its manifest, first {missing[0]}')
+                results.append(BatchResult([job], 'invalid', f'Missing {", ".join(missing)}'))
+            else:
+                valid.append(job)
+        if valid:
+            results.append(await self._commit_batch(valid))
+        return results
+
+    async def _commit_batch(self, jobs: list) -> BatchResult:
+        # Anything raised, timeouts above all, is reported as a failure of the stage it happened in
+        # so the uploads in the batch are spooled rather than lost
+        stage = 'pull'
+        try:
+            pull_status = await self.sync.ensure_fresh()
+            if pull_status != 'Completed':
+                return BatchResult(jobs, 'pull', pull_status)
+            stage = 'commit'
+            for job in jobs:
+                merge_tree(job.workspace, self.directory)
+            staged = await utils.git_add_paths(self.loop, self.directory,
+                                               [path for job in jobs for path in job.manifest])
+            if staged is not None and not staged:
+                return BatchResult(jobs, 'commit', staged.output)
+            dinos = sum(job.dino_count for job in jobs)
+            # Replayed uploads may already be committed, only commit when something is staged
+            if await utils.git_has_staged(self.loop, self.directory):
+                commit = await utils.git_commit(self.loop, self.directory,
+                                                f'Uploaded {dinos} dinos from {len(jobs)} submissions')
+                if not commit:
+                    return BatchResult(jobs, 'commit', commit.output)
+            stage = 'push'
+            push_status = await utils.git_push(self.loop, self.directory)
+            if push_status != 'Completed':
+                return BatchResult(jobs, 'push', push_status)
+            commit_log.info(f'Committed {dinos} dinos from {len(jobs)} submissions')
+            return BatchResult(jobs)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            commit_log.exception(f'git {stage} raised for a batch of {len(jobs)} uploads')
+            return BatchResult(jobs, stage, f'{type(e).__name__} {e}'.strip())
+
+    def close(self):
+        self.task.cancel()
+        self.sync.close()
+        self.upkeep.release()
+        for job, future in self.pending:
+            future.cancel()
+        self.pending = list()
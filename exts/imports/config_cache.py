@@ -0,0 +1,104 @@
+"""
+===
+
+MIT License
+
+Copyright (c) 2018 Dusty.P https://github.com/dustinpianalto
+
+Permission is hereby granted, free of charge, to any person obtaining
+a copy of this software and associated documentation files (the
+"Software"), to deal in the Software without restriction, including
+without limitation the rights to use, copy, modify, merge, publish,
+distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to
+the following conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+
+
+import json
+import os
+import re
+from threading import Lock
+
+config_dir = 'config/'
+bot_config_file = 'bot_config.json'
+
+_lock = Lock()
+_snapshot = None
+
+
+class KeepBlocks(frozenset):
+    """Section names to keep, with every other accepted case variant precomputed.
+
+    ``renames`` maps the lowercased name of a section to the keep block it
+    is renamed to: the lowercase block if there is one, otherwise the block
+    that is its title cased form. Exact names are kept without renaming.
+    """
+    def __new__(cls, blocks=()):
+        self = super().__new__(cls, blocks)
+        self.renames = dict()
+        for block in self:
+            if block == block.lower().title():
+                self.renames[block.lower()] = block
+        for block in self:
+            if block == block.lower():
+                self.renames[block] = block
+        return self
+
+
+class ConfigSnapshot:
+    """Parsed copy of bot_config.json with the lookups the file processors need."""
+    def __init__(self, config: dict, mtime: float):
+        self.config = config
+        self.mtime = mtime
+        self.mods = config['mods']
+        self.max_member_size = config.get('max_member_size', 16777216)
+        self.keep_blocks = {file_type: KeepBlocks(blocks) for file_type, blocks in config['keep_blocks'].items()}
+        self.ignore_patterns = {file_type: self._compile(strings)
+                                for file_type, strings in config['ignore_strings'].items()}
+
+    @staticmethod
+    def _compile(strings):
+        """Build a single alternation of the lowercased strings so each line is scanned once.
+
+        Lines are lowercased before matching, which is much faster than re.IGNORECASE.
+        """
+        if not strings:
+            return None
+        return re.compile('|'.join(re.escape(string.lower()) for string in strings))
+
+    def __repr__(self):
+        return f'<ConfigSnapshot mtime={self.mtime}>'
+
+
+def get_config() -> ConfigSnapshot:
+    """Return the cached snapshot, reloading it when the file on disk has changed."""
+    global _snapshot
+    path = f'{config_dir}{bot_config_file}'
+    mtime = os.stat(path).st_mtime
+    snapshot = _snapshot
+    if snapshot is None or snapshot.mtime != mtime:
+        with _lock:
+            if _snapshot is None or _snapshot.mtime != mtime:
+                with open(path) as f:
+                    _snapshot = ConfigSnapshot(json.load(f), mtime)
+            snapshot = _snapshot
+    return snapshot
+
+
+def invalidate():
+    global _snapshot
+    with _lock:
+        _snapshot = None
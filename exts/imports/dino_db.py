@@ -0,0 +1,156 @@
+"""
+===
+
+MIT License
+
+Copyright (c) 2018 Dusty.P https://github.com/dustinpianalto
+
+Permission is hereby granted, free of charge, to any person obtaining
+a copy of this software and associated documentation files (the
+"Software"), to deal in the Software without restriction, including
+without limitation the rights to use, copy, modify, merge, publish,
+distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to
+the following conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+
+
+from .misc_classes import Dino
+
+schema = '''
+create table if not exists dino_submissions (
+    upload_id text not null,
+    filename text not null,
+    dino_guid uuid not null,
+    author_id bigint not null,
+    server_guid uuid not null,
+    official boolean not null,
+    singleplayer boolean not null,
+    dino_id1 bigint not null,
+    dino_id2 bigint not null,
+    dino_class text not null,
+    species text not null,
+    is_female boolean not null,
+    neutered boolean not null,
+    tamer text not null,
+    tamed_name text not null,
+    imprinter text not null,
+    mutations_male integer not null,
+    mutations_female integer not null,
+    baby_age real not null,
+    level integer not null,
+    imprinting_quality real not null,
+    submitted_at timestamp not null,
+    primary key (upload_id, filename)
+);
+create table if not exists dino_stats (
+    upload_id text not null,
+    filename text not null,
+    stat text not null,
+    value real not null,
+    primary key (upload_id, filename, stat)
+);
+create table if not exists dino_colors (
+    upload_id text not null,
+    filename text not null,
+    region smallint not null,
+    r real not null,
+    g real not null,
+    b real not null,
+    a real not null,
+    primary key (upload_id, filename, region)
+);
+create table if not exists dino_ancestry (
+    upload_id text not null,
+    filename text not null,
+    line text not null,
+    generation smallint not null,
+    male_name text not null,
+    male_id1 bigint not null,
+    male_id2 bigint not null,
+    female_name text not null,
+    female_id1 bigint not null,
+    female_id2 bigint not null,
+    primary key (upload_id, filename, line, generation)
+);
+create index if not exists dino_submissions_search_idx on dino_submissions (lower(species), is_female, level);
+create index if not exists dino_submissions_guid_idx on dino_submissions (dino_guid, submitted_at);
+create index if not exists dino_submissions_server_idx on dino_submissions (server_guid);
+create index if not exists dino_stats_value_idx on dino_stats (stat, value);
+'''
+
+columns = {
+    'dino_submissions': ('upload_id', 'filename', 'dino_guid', 'author_id', 'server_guid', 'official',
+                         'singleplayer', 'dino_id1', 'dino_id2', 'dino_class', 'species', 'is_female', 'neutered',
+                         'tamer', 'tamed_name', 'imprinter', 'mutations_male', 'mutations_female', 'baby_age',
+                         'level', 'imprinting_quality', 'submitted_at'),
+    'dino_stats': ('upload_id', 'filename', 'stat', 'value'),
+    'dino_colors': ('upload_id', 'filename', 'region', 'r', 'g', 'b', 'a'),
+    'dino_ancestry': ('upload_id', 'filename', 'line', 'generation', 'male_name', 'male_id1', 'male_id2',
+                      'female_name', 'female_id1', 'female_id2'),
+}
+
+
+# Any fixed number will do, it only has to be the same in every process that creates the tables
+schema_lock = 7316504
+
+
+async def create_tables(pool):
+    """Create the tables, one process at a time.
+
+    Concurrent create table if not exists can still fail on the pg_type
+    unique index, so the schema is run under a transaction level advisory lock.
+    """
+    async with pool.acquire() as con:
+        async with con.transaction():
+            await con.execute('select pg_advisory_xact_lock($1)', schema_lock)
+            await con.execute(schema)
+
+
+def dino_records(upload_id: str, author_id: int, server_guid: str, official: bool, singleplayer: bool,
+                 submitted_at, dinos_data: dict) -> dict:
+    """Turn a parsed upload into rows for every table, keyed by table name."""
+    records = {table: list() for table in columns}
+    for filename, dino_ini in dinos_data.items():
+        dino = Dino(dino_ini)
+        data = dino.dino_data
+        # Free text fields come from the file as is, Dino converts anything that looks like a number
+        raw = dino_ini['Dino Data']
+        records['dino_submissions'].append((upload_id, filename, str(dino.guid), author_id, server_guid, official,
+                                            singleplayer, data['DinoID1'], data['DinoID2'], raw['DinoClass'],
+                                            raw['DinoNameTag'], bool(data['bIsFemale']), bool(data['bNeutered']),
+                                            raw['TamerString'], raw['TamedName'], raw['ImprinterName'],
+                                            int(data['RandomMutationsMale']), int(data['RandomMutationsFemale']),
+                                            float(data['BabyAge']), int(data['CharacterLevel']),
+                                            float(data['DinoImprintingQuality']), submitted_at))
+        records['dino_stats'].extend((upload_id, filename, stat, value) for stat, value in dino.stats.items())
+        records['dino_colors'].extend((upload_id, filename, region, color.r, color.g, color.b, color.a)
+                                      for region, color in enumerate(dino.colors))
+        for line, key in (('female', 'DinoAncestors_'), ('male', 'DinoAncestorsMale_')):
+            records['dino_ancestry'].extend((upload_id, filename, line, generation,
+                                             parents['MaleName'], int(parents['MaleDinoID1']),
+                                             int(parents['MaleDinoID2']), parents['FemaleName'],
+                                             int(parents['FemaleDinoID1']), int(parents['FemaleDinoID2']))
+                                            for generation, parents in enumerate(dino.ancestry.get(key, [])))
+    return records
+
+
+async def store_dinos(pool, records: dict):
+    """Write every table with a single COPY inside one transaction."""
+    async with pool.acquire() as con:
+        async with con.transaction():
+            for table, rows in records.items():
+                if rows:
+                    await con.copy_records_to_table(table, records=rows, columns=columns[table])
@@ -0,0 +1,105 @@
+"""
+===
+
+MIT License
+
+Copyright (c) 2018 Dusty.P https://github.com/dustinpianalto
+
+Permission is hereby granted, free of charge, to any person obtaining
+a copy of this software and associated documentation files (the
+"Software"), to deal in the Software without restriction, including
+without limitation the rights to use, copy, modify, merge, publish,
+distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to
+the following conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+
+
+from collections import OrderedDict
+from configparser import DuplicateOptionError, DuplicateSectionError, MissingSectionHeaderError, ParsingError
+
+
+class DinoIni(OrderedDict):
+    """Sections of a DinoExport file mapped to their options.
+
+    Stands in for the ConfigParser the exports used to be loaded into and
+    writes the same bytes as ``ConfigParser.write``.
+    """
+    def sections(self) -> list:
+        return list(self)
+
+    def has_section(self, section) -> bool:
+        return section in self
+
+    def write(self, fp, space_around_delimiters: bool=True):
+        delimiter = ' = ' if space_around_delimiters else '='
+        for section, options in self.items():
+            fp.write(f'[{section}]\n')
+            for key, value in options.items():
+                value = str(value).replace('\n', '\n\t')
+                fp.write(f'{key}{delimiter}{value}\n')
+            fp.write('\n')
+
+
+def read_dino_ini(in_file, keep_blocks, name: str='<string>') -> DinoIni:
+    """Tokenize a DinoExport file, keeping only the sections listed in keep_blocks.
+
+    keep_blocks is a config_cache.KeepBlocks. Sections matching one of its
+    other case variants are renamed and moved after the others, the same
+    as process_file does with rename_section.
+    """
+    kept = DinoIni()
+    renamed = DinoIni()
+    options = None
+    key = None
+    seen = set()
+    for lineno, line in enumerate(in_file, start=1):
+        value = line.strip()
+        if not value or value[0] in '#;':
+            continue
+        if key is not None and line[0] in ' \t':
+            # Indented lines continue the previous value
+            options[key] = f'{options[key]}\n{value}'
+            continue
+        if value[0] == '[' and ']' in value:
+            section = value[1:value.rindex(']')]
+            if section in seen:
+                raise DuplicateSectionError(section, name, lineno)
+            seen.add(section)
+            key = None
+            if section in keep_blocks:
+                target = kept
+            elif section.lower() in keep_blocks.renames:
+                target, section = renamed, keep_blocks.renames[section.lower()]
+            else:
+                # Skipped section, its options are read and thrown away
+                options = dict()
+                continue
+            if section in kept or section in renamed:
+                raise DuplicateSectionError(section, name, lineno)
+            options = target[section] = OrderedDict()
+            continue
+        if options is None:
+            raise MissingSectionHeaderError(name, lineno, line)
+        eq, colon = value.find('='), value.find(':')
+        split = eq if colon < 0 or 0 <= eq < colon else colon
+        key = value[:split].rstrip()
+        if split < 0 or not key:
+            raise ParsingError(name)
+        if key in options:
+            raise DuplicateOptionError(section, key, name, lineno)
+        options[key] = value[split + 1:].lstrip()
+    kept.update(renamed)
+    return kept
@@ -0,0 +1,150 @@
+"""
+===
+
+MIT License
+
+Copyright (c) 2018 Dusty.P https://github.com/dustinpianalto
+
+Permission is hereby granted, free of charge, to any person obtaining
+a copy of this software and associated documentation files (the
+"Software"), to deal in the Software without restriction, including
+without limitation the rights to use, copy, modify, merge, publish,
+distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to
+the following conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+
+
+import asyncio
+import json
+import logging
+from .guid import Guid
+
+guild_cache_log = logging.getLogger('guild_cache')
+guild_config_columns = 'guild_id, prefix, channel_lockdown, allowed_channels, admin_roles'
+notify_channel = 'guild_config_changed'
+
+
+class GuildConfig:
+    """A guild_config row with the channel and role lists parsed into sets."""
+    def __init__(self, prefix: str=None, channel_lockdown: bool=False, allowed_channels=None, admin_roles=None):
+        self.prefix = prefix
+        self.channel_lockdown = bool(channel_lockdown)
+        if isinstance(allowed_channels, str):
+            allowed_channels = json.loads(allowed_channels)
+        self.allowed_channels = frozenset(allowed_channels or ())
+        self.admin_roles = frozenset(admin_roles or ())
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(row['prefix'], row['channel_lockdown'], row['allowed_channels'], row['admin_roles'])
+
+    def __repr__(self):
+        return (f'<GuildConfig prefix={self.prefix!r} channel_lockdown={self.channel_lockdown} '
+                f'allowed_channels={len(self.allowed_channels)} admin_roles={len(self.admin_roles)}>')
+
+
+class GuildConfigCache(dict):
+    """guild_config rows by guild id, loaded once and kept up to date by the writers.
+
+    ``warm`` loads every row at startup. A guild that is not cached yet is
+    fetched on first use, and a guild with no row is cached as the default
+    config, so after that reads never touch the database. Anything that
+    writes guild_config calls ``publish`` for that guild, which updates
+    this cache and sends a NOTIFY. Every other process sharing the table
+    refreshes just that guild from its ``listen`` connection.
+    """
+    def __init__(self, pool):
+        super().__init__()
+        self.pool = pool
+        # Tags our own notifications so we don't refetch what we just wrote
+        self.origin = str(Guid())
+        self.listener = None
+
+    async def warm(self):
+        rows = await self.pool.fetch(f'select {guild_config_columns} from guild_config')
+        self.clear()
+        for row in rows:
+            self[row['guild_id']] = GuildConfig.from_row(row)
+        guild_cache_log.info(f'Cached config for {len(self)} guilds')
+
+    async def refresh(self, guild_id: int) -> GuildConfig:
+        row = await self.pool.fetchrow(f'select {guild_config_columns} from guild_config where guild_id = $1',
+                                       guild_id)
+        self[guild_id] = GuildConfig.from_row(row) if row is not None else GuildConfig()
+        return self[guild_id]
+
+    async def fetch(self, guild_id: int) -> GuildConfig:
+        config = self.get(guild_id)
+        if config is None:
+            config = await self.refresh(guild_id)
+        return config
+
+    def update_guild(self, guild_id: int, **fields) -> GuildConfig:
+        """Apply a write that has already been made to the database."""
+        old = self.get(guild_id, GuildConfig())
+        values = dict(prefix=old.prefix, channel_lockdown=old.channel_lockdown,
+                      allowed_channels=old.allowed_channels, admin_roles=old.admin_roles)
+        values.update(fields)
+        self[guild_id] = GuildConfig(**values)
+        return self[guild_id]
+
+    async def publish(self, guild_id: int, **fields):
+        """Apply a write that has been made to the database here and tell the other processes about it.
+
+        With no fields the guild is dropped, for rows that were deleted.
+        """
+        if fields:
+            self.update_guild(guild_id, **fields)
+        else:
+            self.pop(guild_id, None)
+        await self.pool.execute('select pg_notify($1, $2)', notify_channel, f'{self.origin}:{guild_id}')
+
+    def _on_notify(self, connection, pid, channel, payload):
+        origin, guild_id = payload.split(':')
+        if origin != self.origin:
+            guild_cache_log.debug(f'guild_config changed for {guild_id} in another process')
+            # Dropped first so that, if the refresh fails, the next fetch loads it instead of the stale config
+            self.pop(int(guild_id), None)
+            asyncio.ensure_future(self._refresh_changed(int(guild_id)))
+
+    async def _refresh_changed(self, guild_id: int):
+        try:
+            await self.refresh(guild_id)
+        except Exception:
+            guild_cache_log.exception(f'Could not refresh guild_config for {guild_id}, it is loaded on next use')
+
+    async def listen(self, connect, check_interval: float=30.0):
+        """Hold a connection from ``connect`` listening for changes, reconnecting if it drops.
+
+        Anything missed while disconnected is caught up on by warming the whole cache again.
+        """
+        while True:
+            try:
+                connection = await connect()
+                await connection.add_listener(notify_channel, self._on_notify)
+                if self.listener is not None:
+                    await self.warm()
+                self.listener = connection
+                while not connection.is_closed():
+                    await asyncio.sleep(check_interval)
+                guild_cache_log.warning('guild_config listener connection closed, reconnecting')
+            except asyncio.CancelledError:
+                if self.listener is not None:
+                    await self.listener.close()
+                raise
+            except Exception:
+                guild_cache_log.exception('guild_config listener failed, reconnecting')
+                await asyncio.sleep(check_interval)
@@ -0,0 +1,218 @@
+"""
+===
+
+MIT License
+
+Copyright (c) 2018 Dusty.P https://github.com/dustinpianalto
+
+Permission is hereby granted, free of charge, to any person obtaining
+a copy of this software and associated documentation files (the
+"Software"), to deal in the Software without restriction, including
+without limitation the rights to use, copy, modify, merge, publish,
+distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to
+the following conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+
+
+import asyncio
+import logging
+import os
+from datetime import datetime
+from time import time
+from . import utils
+
+maintenance_log = logging.getLogger('maintenance')
+
+# Run in order, each one is skipped once uploads start arriving again
+maintenance_steps = [('repack', '-a', '-d', '-l'),
+                     ('prune', '--expire=2.weeks.ago'),
+                     ('commit-graph', 'write', '--reachable')]
+
+
+class MaintenanceReport:
+    """Timings of a reference ``git status`` before and after one maintenance run."""
+    def __init__(self, started: datetime, before: float):
+        self.started = started
+        self.before = before
+        self.after = None
+        self.steps = list()
+
+    @property
+    def complete(self) -> bool:
+        return len(self.steps) == len(maintenance_steps) and all(self.steps)
+
+    def __str__(self):
+        lines = [f'Started {self.started.strftime("%Y-%m-%d %H:%M:%S")} UTC',
+                 f'git status before: {self.before:.3f}s']
+        for result in self.steps:
+            lines.append(f'git {" ".join(result.args[1:])}: '
+                         f'{"ok" if result else f"failed ({result.returncode})"} in {result.duration:.1f}s')
+        if self.after is not None:
+            lines.append(f'git status after: {self.after:.3f}s')
+        if not self.complete:
+            lines.append('Stopped before every step ran.')
+        return '\n'.join(lines)
+
+
+class ActivityBoard:
+    """When each bot process sharing a repo went idle, one small file per process id.
+
+    A file holds the time the process went idle, or ``busy``. Files of
+    processes that are no longer running are removed when the board is read.
+    """
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.path = f'{directory}/{os.getpid()}'
+        os.makedirs(directory, exist_ok=True)
+
+    def publish(self, idle_since: float=None):
+        with open(f'{self.path}.tmp', 'w') as f:
+            f.write('busy' if idle_since is None else str(idle_since))
+        os.replace(f'{self.path}.tmp', self.path)
+
+    @staticmethod
+    def _running(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def others_idle_for(self) -> float:
+        """Seconds every other running process has been idle for, 0 if any of them is busy."""
+        idle_for = float('inf')
+        now = time()
+        for name in os.listdir(self.directory):
+            if not name.isdigit() or int(name) == os.getpid():
+                continue
+            if not self._running(int(name)):
+                os.remove(f'{self.directory}/{name}')
+                continue
+            try:
+                with open(f'{self.directory}/{name}') as f:
+                    state = f.read()
+            except FileNotFoundError:
+                continue
+            if state == 'busy':
+                return 0.0
+            idle_for = min(idle_for, now - float(state))
+        return idle_for
+
+    def close(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class RepoMaintenance:
+    """Repacks, prunes and writes the commit-graph of a repo while uploads are idle.
+
+    A run is due every ``interval`` seconds, and starts once the pipeline
+    has been idle for ``idle_for`` seconds with nothing waiting in the
+    scheduler's commit window. The whole run holds the scheduler's lock,
+    so it never overlaps a commit, it is only started if the lock is free
+    right away, and it stops between steps if uploads start queueing again.
+
+    Every bot process sharing the repo publishes its idle state to an
+    ActivityBoard every ``poll`` seconds, and a run also waits for all of
+    them to be idle. Only the process holding the scheduler's ``upkeep``
+    lock runs maintenance.
+    """
+    def __init__(self, loop, scheduler, pipeline,
+                 interval: float=21600.0, idle_for: float=300.0, poll: float=10.0):
+        self.loop = loop
+        self.scheduler = scheduler
+        self.directory = scheduler.directory
+        self.lock = scheduler.lock
+        self.pipeline = pipeline
+        self.interval = interval
+        self.idle_for = idle_for
+        self.poll = poll
+        self.last_run = None
+        self.last_report = None
+        self.board = ActivityBoard(f'{os.path.normpath(self.directory)}.activity')
+        self._last_busy = 0.0
+        self.task = loop.create_task(self._run())
+
+    def _idle_since(self) -> float:
+        """Wall clock time this process went idle, or None while it is busy."""
+        if self.pipeline.idle_since is None or self.scheduler.pending:
+            self._last_busy = time()
+            return None
+        return max(time() - (self.loop.time() - self.pipeline.idle_since), self._last_busy)
+
+    def _idle(self) -> bool:
+        idle_since = self._idle_since()
+        if idle_since is None:
+            return False
+        return min(time() - idle_since, self.board.others_idle_for()) >= self.idle_for
+
+    async def _status_time(self) -> float:
+        result = await utils.run_git(self.directory, 'status', '--porcelain', timeout=600)
+        return result.duration
+
+    async def run(self, force: bool=False) -> MaintenanceReport:
+        """Run the maintenance steps, returns None if the lock was busy and force is not set."""
+        if force:
+            await self.lock.acquire()
+        elif not await self.lock.try_acquire():
+            return None
+        try:
+            report = MaintenanceReport(datetime.utcnow(), await self._status_time())
+            for step in maintenance_steps:
+                if not force and not self._idle():
+                    maintenance_log.info('Uploads arrived, stopping maintenance early')
+                    break
+                result = await utils.run_git(self.directory, *step, timeout=3600)
+                report.steps.append(result)
+                if not result:
+                    maintenance_log.warning(f'git {" ".join(step)} failed: {result.output}')
+                    break
+            report.after = await self._status_time()
+        finally:
+            self.lock.release()
+        self.last_run = self.loop.time()
+        self.last_report = report
+        maintenance_log.info(f'Maintenance finished, git status {report.before:.3f}s -> {report.after:.3f}s')
+        return report
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.poll)
+            try:
+                self.board.publish(self._idle_since())
+            except OSError:
+                maintenance_log.exception('Could not publish idle state')
+            if not self.scheduler.upkeep.try_acquire():
+                continue
+            if self.last_run is not None and self.loop.time() - self.last_run < self.interval:
+                continue
+            if not self._idle():
+                continue
+            try:
+                await self.run()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                maintenance_log.exception(f'Maintenance of {self.directory} failed')
+                self.last_run = self.loop.time()
+
+    def close(self):
+        self.task.cancel()
+        self.board.close()
@@ -1,5 +1,6 @@
 from configparser import ConfigParser
 from . import guid
+from .dino_ini import DinoIni
 from distutils.util import strtobool
 from collections import OrderedDict
 
@@ -76,8 +77,9 @@ class Dino:
             self.stats = self._get_colors()
             self.ancestry = self._get_ancestry()
             self.guid = self.get_guid()
-        elif isinstance(dino_data, ConfigParser):
-            self.dino_data = self._get_dino_data(list(dino_data['Dino Data'].values()))
+        elif isinstance(dino_data, (ConfigParser, DinoIni)):
+            self.dino_data = self._get_dino_data([dino_data['Dino Data'].get(key, 0)
+                                                  for key in config_setup['Dino Data']])
             self.colors = self._get_colors(list(dino_data['Colorization'].values()))
             self.stats = self._get_stats(list(dino_data['Max Character Status Values'].values()))
             self.ancestry = self._get_ancestry(list(dino_data['Dino Ancestry'].values()), dino_data)
@@ -86,7 +88,7 @@ class Dino:
             raise InvalidConfig('Arguments don\'t match any valid configuration.')
 
     def get_guid(self) -> guid.Guid:
-        return guid.Guid(self.dino_data['DinoID1'], self.dino_data['DinoID2'])
+        return guid.Guid.from_int(self.dino_data['DinoID1'], self.dino_data['DinoID2'])
 
     @staticmethod
     def _get_colors(colorization: list=list()) -> [Color]:
@@ -132,7 +134,7 @@ class Dino:
         return dino_dict
 
     @staticmethod
-    def _get_ancestry(ancestry: list=list(), data: ConfigParser=None) -> OrderedDict:
+    def _get_ancestry(ancestry: list=list(), data: (ConfigParser, DinoIni)=None) -> OrderedDict:
         ancestry_dict = OrderedDict()
         if ancestry != list():
             ancestry_dict['DinoAncestorsCount'] = int(ancestry[0])
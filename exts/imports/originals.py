@@ -0,0 +1,101 @@
+"""
+===
+
+MIT License
+
+Copyright (c) 2018 Dusty.P https://github.com/dustinpianalto
+
+Permission is hereby granted, free of charge, to any person obtaining
+a copy of this software and associated documentation files (the
+"Software"), to deal in the Software without restriction, including
+without limitation the rights to use, copy, modify, merge, publish,
+distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to
+the following conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+
+
+import json
+import os
+from datetime import datetime
+
+
+index_file = 'index.jsonl'
+# How far back from the end of index.jsonl to look for lines an earlier attempt already merged
+tail_window = 1048576
+
+
+class OriginalsArchive:
+    """Content addressed store for the original upload zips inside the storage repo.
+
+    Each distinct zip is kept once under objects/ by its sha1, and every
+    upload of it adds a line to index.jsonl with who sent it, when and from
+    which guild. Git already stores each object once and compresses it in
+    its packs, so nothing here bundles or recompresses them.
+    Nothing is written to the repo directly: ``stage`` puts the zip and the
+    upload's index line in its job workspace, and merge_tree moves them in
+    under the commit lock like every other file of the upload.
+    Paths returned are relative to the storage repo, ready for a manifest.
+    """
+    def __init__(self, storage_dir: str, name: str='orig'):
+        self.storage_dir = storage_dir
+        self.name = name
+        self.index_path = f'{name}/{index_file}'
+
+    def object_path(self, digest: str) -> str:
+        return f'{self.name}/objects/{digest[:2]}/{digest}.zip'
+
+    def has(self, digest: str) -> bool:
+        return os.path.isfile(f'{self.storage_dir}/{self.object_path(digest)}')
+
+    def stage(self, workspace: str, upload_id: str, digest: str, data: bytes, filename: str, author_id: int,
+              guild_id, uploaded_at: datetime) -> list:
+        """Write an upload's index line, and its zip unless the repo has it already, into its workspace."""
+        paths = list()
+        if not self.has(digest):
+            path = self.object_path(digest)
+            os.makedirs(os.path.dirname(f'{workspace}/{path}'), exist_ok=True)
+            with open(f'{workspace}/{path}', 'wb') as f:
+                f.write(data)
+            paths.append(path)
+        os.makedirs(f'{workspace}/{self.name}', exist_ok=True)
+        line = json.dumps({'upload_id': upload_id, 'sha1': digest, 'filename': filename, 'size': len(data),
+                           'author_id': author_id, 'guild_id': guild_id, 'uploaded_at': uploaded_at.isoformat()})
+        with open(f'{workspace}/{self.index_path}', 'w') as f:
+            f.write(line + '\n')
+        paths.append(self.index_path)
+        return paths
+
+
+def append_index(src: str, dst: str):
+    """Append the lines of an upload's index.jsonl to the one in the repo.
+
+    A replayed upload may already have had its line merged, or even
+    committed with another batch, by an attempt that failed later on, so
+    lines already near the end of the repo's index are skipped.
+    """
+    with open(src) as f:
+        lines = f.readlines()
+    try:
+        with open(dst, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - tail_window))
+            tail = f.read().decode(errors='replace')
+    except FileNotFoundError:
+        tail = ''
+    lines = [line for line in lines if line not in tail]
+    if lines:
+        with open(dst, 'a') as f:
+            f.writelines(lines)
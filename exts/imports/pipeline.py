@@ -0,0 +1,168 @@
+"""
+===
+
+MIT License
+
+Copyright (c) 2018 Dusty.P https://github.com/dustinpianalto
+
+Permission is hereby granted, free of charge, to any person obtaining
+a copy of this software and associated documentation files (the
+"Software"), to deal in the Software without restriction, including
+without limitation the rights to use, copy, modify, merge, publish,
+distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to
+the following conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+
+
+import asyncio
+import logging
+import os
+import shutil
+from configparser import ConfigParser
+from . import originals, process_files
+from .guid import Guid
+
+pipeline_log = logging.getLogger('pipeline')
+work_dir = 'submissions_temp/work'
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class UploadJob:
+    """State for a single upload as it moves through the pipeline.
+
+    Every job gets its own workspace directory so concurrent uploads
+    never write into the same place before they are persisted.
+    """
+    def __init__(self, ctx, attachment, official: str='unofficial', singleplayer: bool=False):
+        self.id = Guid()
+        self.ctx = ctx
+        self.msg = None
+        self.attachment = attachment
+        self.official = official
+        self.singleplayer = singleplayer
+        self.workspace = f'{work_dir}/{self.id}'
+        self.file = None
+        self.digest = None
+        self.cache_key = None
+        self.cached = None
+        self.originals = list()
+        self.persisted = False
+        self.manifest = list()
+        self.game_ini = ConfigParser()
+        self.dinos_data = dict()
+        self.mods = list()
+        self.server_guid = Guid()
+
+    @property
+    def dino_count(self) -> int:
+        return len(self.dinos_data)
+
+    def originals_only(self):
+        """Strip the job down to its original zip and index line, for uploads that stop before persisting."""
+        # Anything else in the workspace is a render that never finished
+        keep = {path.split('/')[0] for path in self.originals}
+        for name in os.listdir(self.workspace):
+            if name not in keep:
+                shutil.rmtree(os.path.join(self.workspace, name))
+        self.manifest = list(self.originals)
+        self.dinos_data = dict()
+
+    def cleanup(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        shutil.rmtree(self.workspace, ignore_errors=True)
+
+    def __repr__(self):
+        return f'<UploadJob id={self.id} author={self.ctx.author.id}>'
+
+
+class UploadPipeline:
+    """Bounded job queue served by a fixed number of workers.
+
+    ``run`` queues a job with the stages it should go through and waits
+    for a worker to finish them. The queue size applies back pressure
+    and the worker count caps how many uploads are held in memory at once.
+    ``idle_since`` is the loop time the last job finished while nothing
+    else was queued or running, or None while the pipeline is busy.
+    """
+    def __init__(self, loop, workers: int=4, queue_size: int=50):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.busy = 0
+        self.idle_since = loop.time()
+        self.workers = [loop.create_task(self._worker(n)) for n in range(workers)]
+
+    async def run(self, job: UploadJob, *stages):
+        future = self.loop.create_future()
+        self.idle_since = None
+        await self.queue.put((job, stages, future))
+        return await future
+
+    async def _worker(self, n: int):
+        while True:
+            job, stages, future = await self.queue.get()
+            self.busy += 1
+            try:
+                for stage in stages:
+                    if future.cancelled():
+                        break
+                    pipeline_log.debug(f'Worker {n} running {stage.__name__} for {job}')
+                    await stage(job)
+            except Exception as e:
+                pipeline_log.exception(f'Worker {n} failed on {job}')
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(job)
+            finally:
+                self.busy -= 1
+                self.queue.task_done()
+                if not self.busy and self.queue.empty():
+                    self.idle_since = self.loop.time()
+
+    def close(self):
+        for worker in self.workers:
+            worker.cancel()
+
+
+def merge_tree(src: str, dst: str) -> list:
+    """Copy every file under src into the same relative location under dst.
+
+    src is left as it is, so an upload whose commit fails still has all of
+    its files to spool. Rendered submission directories are merged with
+    process_files.merge_rendered so their fingerprints are checked against
+    the stored index at this point, not when they were rendered. An
+    upload's originals index.jsonl is appended to the repo's, not copied.
+    """
+    copied = list()
+    for root, dirs, files in os.walk(src):
+        target = os.path.join(dst, os.path.relpath(root, src))
+        os.makedirs(target, exist_ok=True)
+        if process_files.fingerprints_file in files:
+            copied.extend(process_files.merge_rendered(root, target, files))
+            continue
+        for filename in files:
+            if filename == originals.index_file:
+                originals.append_index(os.path.join(root, filename), os.path.join(target, filename))
+            else:
+                shutil.copyfile(os.path.join(root, filename), os.path.join(target, filename))
+            copied.append(os.path.join(target, filename))
+    return copied
@@ -29,35 +29,33 @@ WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 import zipfile
 import os
+import codecs
 import json
+import shutil
 from configparser import ConfigParser
+from . import config_cache
+from .dino_ini import DinoIni, read_dino_ini
 from .guid import Guid
-from shutil import rmtree
-from hashlib import md5
+from hashlib import md5, sha1
+from io import BytesIO, StringIO
 
-config_dir = 'config/'
-bot_config_file = 'bot_config.json'
+fingerprints_file = 'fingerprints.json'
 
 
 class MissingFile(Exception):
     pass
 
 
-def load_zip(file) -> zipfile.ZipFile:
-    return zipfile.ZipFile(file)
+class MemberTooLarge(Exception):
+    pass
 
 
-def check_for_mods(game_file) -> list:
-    mods = list()
-    for line in game_file.readlines():
-        if line.startswith('ModIDS='):
-            mods.append(line.split('=')[1].strip())
-    return mods
+def load_zip(file) -> zipfile.ZipFile:
+    return zipfile.ZipFile(file)
 
 
 def check_for_modded_dinos(dino_data, active_mods) -> list:
-    with open(f'{config_dir}{bot_config_file}') as f:
-        mods = json.load(f)['mods']
+    mods = config_cache.get_config().mods
     for filename, dino in dino_data.items():
         for mod in mods:
             if dino['Dino Data']['DinoClass'].startswith(mod):
@@ -75,134 +73,239 @@ def rename_section(cfg, sec, sec_new):
     return cfg
 
 
-def get_server_guid(server_file):
-    server_file = server_file.encode()
-    m = md5(server_file).hexdigest().encode()
-    guid = Guid(int(m.hex()))
-    return guid
-
-
-def process_file(in_file, file_type) -> ConfigParser:
-    with open(f'{config_dir}{bot_config_file}') as f:
-        bot_config = json.load(f)
-        ignore_strings = bot_config['ignore_strings'][file_type]
-        keep_blocks = bot_config['keep_blocks'][file_type]
-    data = in_file.readlines()
-    # data = [line.decode() for line in in_file]
-    # data = [line.decode(encoding=encoding) for line in in_file]
-    clean_data = list()
-
-    if ignore_strings:
-        for line in data:
-            ignore = 0
-            for string in ignore_strings:
-                if string.lower() in line.lower():
-                    ignore = 1
-            if not ignore:
-                clean_data.append(line)
-    else:
-        clean_data = data
-
+def load_config(clean_data, keep_blocks: config_cache.KeepBlocks) -> ConfigParser:
     config = ConfigParser()
     config.optionxform = str
     config.read_string('\n'.join(clean_data))
     for section in config.sections():
         if section in keep_blocks:
-            pass
-        elif section.lower() in keep_blocks:
-            config = rename_section(config, section, section.lower())
-        elif section.title() in keep_blocks:
-            config = rename_section(config, section, section.title())
+            continue
+        renamed = keep_blocks.renames.get(section.lower())
+        if renamed is not None:
+            config = rename_section(config, section, renamed)
         else:
             config.remove_section(section)
-    print(f"{config.sections()} {config['Dino Ancestry']['DinoAncestorsCount']}")
     return config
 
 
-def process_files(z) -> (ConfigParser, ConfigParser, list, Guid):
+def process_file(in_file, file_type) -> ConfigParser:
+    bot_config = config_cache.get_config()
+    ignore_pattern = bot_config.ignore_patterns[file_type]
+    keep_blocks = bot_config.keep_blocks[file_type]
+
+    if ignore_pattern is not None:
+        search = ignore_pattern.search
+        clean_data = [line for line in in_file if not search(line.lower())]
+    else:
+        clean_data = in_file.readlines()
+    return load_config(clean_data, keep_blocks)
+
+
+def process_game_ini(in_file) -> (ConfigParser, list, Guid):
+    """Clean Game.ini, collect its ModIDS and fingerprint the server in one pass over the lines.
+
+    The server Guid is the md5 of the whole file, fed a line at a time.
+    """
+    bot_config = config_cache.get_config()
+    ignore_pattern = bot_config.ignore_patterns['game.ini']
+    search = ignore_pattern.search if ignore_pattern is not None else None
+    server_hash = md5()
+    mods = list()
+    clean_data = list()
+    for line in in_file:
+        server_hash.update(line.encode())
+        if line.startswith('ModIDS='):
+            mods.append(line.split('=')[1].strip())
+        if search is None or not search(line.lower()):
+            clean_data.append(line)
+    config = load_config(clean_data, bot_config.keep_blocks['game.ini'])
+    return config, mods, Guid.from_bytes(server_hash.digest())
+
+
+def is_submission_file(filename) -> bool:
+    if filename.endswith('.ini'):
+        # ignore any files that don't end with .ini
+        return filename.lower() == 'game.ini' or 'DinoExport' in filename
+    return False
+
+
+def decode_ini(data: bytes) -> str:
+    """Decode an ini file in a single pass based on its BOM or, failing that, its null bytes.
+
+    ARK on Windows usually writes UTF-16-LE with a BOM, but exports that have
+    been re-saved can lose it, in which case every other byte of the ASCII
+    section headers is a null.
+    """
+    if data.startswith(codecs.BOM_UTF16_LE):
+        return data[len(codecs.BOM_UTF16_LE):].decode('utf-16-le')
+    if data.startswith(codecs.BOM_UTF16_BE):
+        return data[len(codecs.BOM_UTF16_BE):].decode('utf-16-be')
+    if data.startswith(codecs.BOM_UTF8):
+        return data.decode('utf-8-sig')
+    sample = data[:64]
+    if len(sample) >= 2 and sample.count(0) * 4 >= len(sample):
+        if sample[1::2].count(0) > sample[0::2].count(0):
+            return data.decode('utf-16-le')
+        return data.decode('utf-16-be')
+    return data.decode('utf-8')
+
+
+def read_member(z, info) -> StringIO:
+    """Decompress a single member, refusing anything over max_member_size once uncompressed.
+
+    The size in the zip header can be forged, so the read is bounded as well.
+    """
+    max_size = config_cache.get_config().max_member_size
+    too_large = MemberTooLarge(f'{os.path.basename(info.filename)} is larger than the '
+                               f'{max_size // 1024}KB limit once uncompressed.')
+    if info.file_size > max_size:
+        raise too_large
+    with z.open(info) as member:
+        data = member.read(max_size + 1)
+    if len(data) > max_size:
+        raise too_large
+    return StringIO(decode_ini(data), newline=None)
+
+
+def process_files(z) -> (ConfigParser, DinoIni, list, Guid):
     dino_data = dict()
     game_config = ConfigParser()
     server_guid = Guid()
     mods = list()
-    path = 'submissions_temp/tmp/'
-    z.extractall(path=path)
-    files = os.listdir(path)
-    for filename in files:
-        if filename.endswith('.ini'):
-            # ignore any files that don't end with .ini
-            if filename.lower() == 'game.ini':
-                # Clean the Game.ini file, removing unnecessary lines
-                try:
-                    with open(f'{path}{filename}', encoding='utf-8') as file:
-                        game_config = process_file(file, 'game.ini')
-                        file.seek(0)
-                        mods = check_for_mods(file)
-                        file.seek(0)
-                        server_file = file.read()
-                except UnicodeDecodeError as e:
-                    print(e)
-                    try:
-                        with open(f'{path}{filename}', 'rb') as file:
-                            contents = file.read()
-                            with open(f'{path}utf8{filename}', 'wb') as f:
-                                f.write(contents.decode('utf-16-le').replace('\uFEFF', '').encode('utf-8'))
-                        with open(f'{path}utf8{filename}', encoding='utf-8') as file:
-                            game_config = process_file(file, 'game.ini')
-                            file.seek(0)
-                            mods = check_for_mods(file)
-                            file.seek(0)
-                            server_file = file.read()
-                    except UnicodeDecodeError as e:
-                        print(e)
-                        return 0, 0, 0
-                server_guid = get_server_guid(server_file)
-            elif 'DinoExport' in filename:
-                # Get the contents of all DinoExport_*.ini files loaded into a dict
-                print(filename)
-                try:
-                    with open(f'{path}{filename}', encoding='utf-8') as file:
-                        dino_data[filename] = process_file(file, 'dino.ini')
-                except UnicodeDecodeError as e:
-                    print(e)
-                    try:
-                        with open(f'{path}{filename}', 'rb') as file:
-                            contents = file.read()
-                            with open(f'{path}utf8{filename}', 'wb') as f:
-                                f.write(contents.decode('utf-16-le').replace('\uFEFF', '').encode('utf-8'))
-                        with open(f'{path}utf8{filename}', encoding='utf-8') as file:
-                            dino_data[filename] = process_file(file, 'dino.ini')
-                    except UnicodeDecodeError as e:
-                        print(e)
-                        return 0, 0, 0
-    rmtree('submissions_temp/tmp')
+    for info in z.infolist():
+        # Only the members we need are decompressed, everything else in the archive is skipped
+        if info.is_dir():
+            continue
+        filename = os.path.basename(info.filename)
+        if not is_submission_file(filename):
+            continue
+        try:
+            file = read_member(z, info)
+        except UnicodeDecodeError as e:
+            print(e)
+            return 0, 0, 0, 0
+        if filename.lower() == 'game.ini':
+            # Clean the Game.ini file, removing unnecessary lines
+            game_config, mods, server_guid = process_game_ini(file)
+        else:
+            # Get the contents of all DinoExport_*.ini files loaded into a dict
+            print(filename)
+            dino_data[filename] = read_dino_ini(file, config_cache.get_config().keep_blocks['dino.ini'], filename)
     if not mods:
         mods = check_for_modded_dinos(dino_data, mods)
     return game_config, dino_data, mods, server_guid
 
 
-def generate_game_ini(game_config, mods, directory):
+def process_zip(data: bytes) -> (ConfigParser, DinoIni, list, Guid):
+    """Entry point for executors, takes the raw zip bytes so it can be sent to a worker process."""
+    with load_zip(BytesIO(data)) as z:
+        return process_files(z)
+
+
+def dino_fingerprint(dino) -> str:
+    """Guid of the dino followed by a hash of everything stored for it, canonicalised by sorting."""
+    canonical = json.dumps({section: options for section, options in dino.items()}, sort_keys=True)
+    return f'{dino["Dino Data"]["Guid"]}:{sha1(canonical.encode()).hexdigest()}'
+
+
+def load_fingerprints(directory) -> dict:
+    try:
+        with open(f'{directory}/{fingerprints_file}') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return dict()
+
+
+def save_fingerprints(directory, fingerprints):
+    # Replaced in one step, renders read the stored index without taking the commit lock
+    with open(f'{directory}/{fingerprints_file}.tmp', 'w') as f:
+        json.dump(fingerprints, f, indent=2, sort_keys=True)
+    os.replace(f'{directory}/{fingerprints_file}.tmp', f'{directory}/{fingerprints_file}')
+
+
+def merge_rendered(src, dst, files) -> list:
+    """Copy one rendered submission directory into storage, under the commit lock.
+
+    The fingerprints written with a render only cover the files that render
+    wrote. Any of them whose fingerprint now matches the stored index are
+    skipped, the rest are copied and their fingerprints merged into the
+    stored index, so it always describes the files actually stored.
+    """
+    with open(f'{src}/{fingerprints_file}') as f:
+        rendered = json.load(f)
+    stored = load_fingerprints(dst)
+    copied = list()
+    for filename in files:
+        if filename == fingerprints_file:
+            continue
+        fingerprint = rendered.get(filename)
+        if fingerprint is not None and stored.get(filename) == fingerprint:
+            continue
+        shutil.copyfile(f'{src}/{filename}', f'{dst}/{filename}')
+        copied.append(f'{dst}/{filename}')
+        if fingerprint is not None:
+            stored[filename] = fingerprint
+    save_fingerprints(dst, stored)
+    copied.append(f'{dst}/{fingerprints_file}')
+    return copied
+
+
+def generate_game_ini(game_config, mods, directory, fingerprints=None) -> bool:
     print(game_config.sections())
     if mods:
         game_config['/script/shootergame.shootergamemode']['ModIDS'] = ', '.join(mods)
-    with open(f'{directory}/Game.ini', 'w') as f:
+    with StringIO() as f:
         game_config.write(f, space_around_delimiters=False)
+        contents = f.getvalue()
+    if fingerprints is not None:
+        fingerprint = sha1(contents.encode()).hexdigest()
+        if fingerprints.get('Game.ini') == fingerprint:
+            return False
+        fingerprints['Game.ini'] = fingerprint
+    with open(f'{directory}/Game.ini', 'w') as f:
+        f.write(contents)
+    return True
 
 
-def generate_dino_files(dino_data, directory):
+def generate_dino_files(dino_data, directory, fingerprints=None) -> list:
+    written = list()
     for filename, dino in dino_data.items():
         print(filename)
-        guid = Guid(int(dino['Dino Data']['DinoID1']), int(dino['Dino Data']['DinoID2']))
+        guid = Guid.from_int(int(dino['Dino Data']['DinoID1']), int(dino['Dino Data']['DinoID2']))
         dino['Dino Data']['Guid'] = str(guid)
+        if fingerprints is not None:
+            fingerprint = dino_fingerprint(dino)
+            if fingerprints.get(filename) == fingerprint:
+                # Already stored and unchanged
+                continue
+            fingerprints[filename] = fingerprint
         with open(f'{directory}/{filename}', 'w') as f:
             dino.write(f, space_around_delimiters=False)
+        written.append(filename)
+    return written
+
 
+def generate_files(storage_dir, author_id, dirname, game_ini, dinos_data, mods, index_dir=None) -> list:
+    """Write the submission under storage_dir and return the paths written, relative to storage_dir.
 
-def generate_files(storage_dir, ctx, dirname, game_ini, dinos_data, mods):
-    if not os.path.isdir(f'{storage_dir}/{ctx.author.id}'):
-        os.mkdir(f'{storage_dir}/{ctx.author.id}')
-    directory = f'{storage_dir}/{ctx.author.id}/{dirname}'
+    If index_dir is given, the fingerprints stored for this author and server
+    under it are used to skip every file that is already stored unchanged,
+    and the fingerprints of the files written are saved alongside them for
+    merge_rendered to fold into the stored index.
+    """
+    if not os.path.isdir(f'{storage_dir}/{author_id}'):
+        os.mkdir(f'{storage_dir}/{author_id}')
+    directory = f'{storage_dir}/{author_id}/{dirname}'
     if not os.path.isdir(directory):
         os.mkdir(directory)
-    generate_game_ini(game_ini, mods, directory)
-    generate_dino_files(dinos_data, directory)
-    return 1
+    fingerprints = load_fingerprints(f'{index_dir}/{author_id}/{dirname}') if index_dir is not None else None
+    manifest = list()
+    if generate_game_ini(game_ini, mods, directory, fingerprints):
+        manifest.append(f'{author_id}/{dirname}/Game.ini')
+    manifest.extend(f'{author_id}/{dirname}/{filename}'
+                    for filename in generate_dino_files(dinos_data, directory, fingerprints))
+    if manifest and fingerprints is not None:
+        save_fingerprints(directory, {os.path.basename(path): fingerprints[os.path.basename(path)]
+                                      for path in manifest})
+        manifest.append(f'{author_id}/{dirname}/{fingerprints_file}')
+    return manifest
@@ -0,0 +1,104 @@
+"""
+===
+
+MIT License
+
+Copyright (c) 2018 Dusty.P https://github.com/dustinpianalto
+
+Permission is hereby granted, free of charge, to any person obtaining
+a copy of this software and associated documentation files (the
+"Software"), to deal in the Software without restriction, including
+without limitation the rights to use, copy, modify, merge, publish,
+distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to
+the following conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+
+
+import asyncio
+import fcntl
+import os
+
+
+class FileLock:
+    """Non-blocking exclusive flock on a file, released when the process exits."""
+    def __init__(self, path: str):
+        self.path = path
+        self._fd = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def try_acquire(self) -> bool:
+        if self._fd is not None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+class ProcessLock:
+    """asyncio.Lock that also holds a FileLock, so it excludes other processes as well as other tasks.
+
+    The file lock is polled every ``poll`` seconds so waiting never blocks the event loop.
+    """
+    def __init__(self, path: str, poll: float=0.1):
+        self.poll = poll
+        self._lock = asyncio.Lock()
+        self._file = FileLock(path)
+
+    def locked(self) -> bool:
+        return self._lock.locked()
+
+    async def acquire(self):
+        await self._lock.acquire()
+        try:
+            while not self._file.try_acquire():
+                await asyncio.sleep(self.poll)
+        except BaseException:
+            self._lock.release()
+            raise
+
+    async def try_acquire(self) -> bool:
+        """Take the lock only if no task or process holds it right now."""
+        if self._lock.locked():
+            return False
+        await self._lock.acquire()
+        if not self._file.try_acquire():
+            self._lock.release()
+            return False
+        return True
+
+    def release(self):
+        self._file.release()
+        self._lock.release()
+
+    async def __aenter__(self):
+        await self.acquire()
+
+    async def __aexit__(self, *args):
+        self.release()
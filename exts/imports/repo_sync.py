@@ -0,0 +1,126 @@
+"""
+===
+
+MIT License
+
+Copyright (c) 2018 Dusty.P https://github.com/dustinpianalto
+
+Permission is hereby granted, free of charge, to any person obtaining
+a copy of this software and associated documentation files (the
+"Software"), to deal in the Software without restriction, including
+without limitation the rights to use, copy, modify, merge, publish,
+distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to
+the following conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+
+
+import asyncio
+import logging
+from datetime import datetime
+from . import utils
+
+sync_log = logging.getLogger('repo_sync')
+
+
+class RepoSync:
+    """Keeps a repo fast-forwarded to its upstream in the background.
+
+    Every ``interval`` seconds, while holding ``lock``, the upstream is
+    fetched and the working tree is fast-forwarded to it. Only the process
+    holding ``upkeep`` does this. ``fresh_as_of`` is when the repo was last
+    known to match the remote. ``ensure_fresh`` asks the remote for its
+    head with ls-remote and only pulls if that commit is not already in HEAD.
+    """
+    def __init__(self, loop, directory: str, lock, upkeep, interval: float=60.0):
+        self.loop = loop
+        self.directory = directory
+        self.lock = lock
+        self.upkeep = upkeep
+        self.interval = interval
+        self.fresh_as_of = None
+        self.remote = None
+        self.branch = None
+        self.task = loop.create_task(self._run())
+
+    async def _upstream(self) -> bool:
+        if self.branch is None:
+            result = await utils.run_git(self.directory, 'rev-parse', '--abbrev-ref',
+                                         '--symbolic-full-name', '@{u}', timeout=10)
+            if not result:
+                sync_log.warning(f'No upstream for {self.directory}: {result.output}')
+                return False
+            self.remote, self.branch = result.stdout.split('/', 1)
+        return True
+
+    async def _contains(self, commit: str) -> bool:
+        return bool(await utils.run_git(self.directory, 'merge-base', '--is-ancestor', commit, 'HEAD', timeout=10))
+
+    async def remote_moved(self) -> bool:
+        """True unless the remote head is known to already be in HEAD."""
+        if not await self._upstream():
+            return True
+        result = await utils.run_git(self.directory, 'ls-remote', '--heads', self.remote,
+                                     f'refs/heads/{self.branch}', timeout=60)
+        if not result or not result.stdout:
+            return True
+        return not await self._contains(result.stdout.split()[0])
+
+    async def ensure_fresh(self) -> str:
+        """Pull only if the remote has moved. The caller must hold ``lock``."""
+        if not await self.remote_moved():
+            self.fresh_as_of = datetime.utcnow()
+            return 'Completed'
+        status = await utils.git_pull(self.loop, self.directory)
+        if status == 'Completed':
+            self.fresh_as_of = datetime.utcnow()
+        return status
+
+    async def sync(self):
+        if not await self._upstream():
+            return
+        # The fetch updates the same refs as a batch's pull and push, so it runs under the lock too.
+        # If a batch holds it, that batch is pulling anyway and this round is skipped.
+        if not await self.lock.try_acquire():
+            return
+        try:
+            fetch = await utils.run_git(self.directory, 'fetch', '--quiet', self.remote, self.branch, timeout=240)
+            if not fetch:
+                sync_log.warning(f'Fetch failed: {fetch.output}')
+                return
+            if not await self._contains('FETCH_HEAD'):
+                merge = await utils.run_git(self.directory, 'merge', '--ff-only', '--quiet', 'FETCH_HEAD')
+                if not merge:
+                    # Local commits that have not been pushed yet, the next commit's pull will merge them
+                    sync_log.info(f'Could not fast-forward {self.directory}: {merge.output}')
+                    return
+            self.fresh_as_of = datetime.utcnow()
+        finally:
+            self.lock.release()
+
+    async def _run(self):
+        while True:
+            try:
+                # Only one of the bot processes sharing the repo keeps it synced
+                if self.upkeep.try_acquire():
+                    await self.sync()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                sync_log.exception(f'Background sync of {self.directory} failed')
+            await asyncio.sleep(self.interval)
+
+    def close(self):
+        self.task.cancel()
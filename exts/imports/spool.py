@@ -0,0 +1,165 @@
+"""
+===
+
+MIT License
+
+Copyright (c) 2018 Dusty.P https://github.com/dustinpianalto
+
+Permission is hereby granted, free of charge, to any person obtaining
+a copy of this software and associated documentation files (the
+"Software"), to deal in the Software without restriction, including
+without limitation the rights to use, copy, modify, merge, publish,
+distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to
+the following conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+
+
+import asyncio
+import json
+import logging
+import os
+import shutil
+from .process_lock import FileLock
+
+spool_log = logging.getLogger('spool')
+
+
+class SpooledUpload:
+    """An upload waiting in the spool, shaped like an UploadJob for the CommitScheduler."""
+    def __init__(self, path: str):
+        self.path = path
+        self.id = os.path.basename(path)
+        self.workspace = f'{path}/files'
+        with open(f'{path}/upload.json') as f:
+            data = json.load(f)
+        self.author_id = data['author_id']
+        self.dino_count = data['dino_count']
+        self.manifest = data['manifest']
+
+    def __repr__(self):
+        return f'<SpooledUpload id={self.id} author={self.author_id}>'
+
+
+class UploadSpool:
+    """On disk queue of rendered uploads that could not be committed.
+
+    Entries are built under a dot-prefixed name and renamed into place, so
+    only complete entries are ever seen by the drainer. The drainer replays
+    them through the CommitScheduler, backing off exponentially while git
+    keeps failing, and picks up whatever was left in the spool on startup.
+    Every bot process can add to the spool but only the one holding the
+    drainer lock replays it. Entries that cannot be read, or that the
+    scheduler reports as invalid, are moved to .quarantine for a human.
+    """
+    def __init__(self, loop, directory: str, scheduler, min_delay: float=30.0, max_delay: float=1800.0):
+        self.loop = loop
+        self.directory = directory
+        self.scheduler = scheduler
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self._added = asyncio.Event()
+        os.makedirs(directory, exist_ok=True)
+        self.quarantine = f'{directory}/.quarantine'
+        self.drainer = FileLock(f'{directory}/.drainer.lock')
+        self.task = loop.create_task(self._drain())
+
+    def add(self, job):
+        """Move a job's rendered files into the spool along with what is needed to commit them."""
+        tmp = f'{self.directory}/.{job.id}'
+        os.makedirs(tmp)
+        if os.path.isdir(job.workspace):
+            shutil.move(job.workspace, f'{tmp}/files')
+        else:
+            os.mkdir(f'{tmp}/files')
+        with open(f'{tmp}/upload.json', 'w') as f:
+            json.dump({'author_id': job.ctx.author.id,
+                       'dino_count': job.dino_count,
+                       'manifest': job.manifest}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp, f'{self.directory}/{job.id}')
+        spool_log.info(f'Spooled {job}')
+        self._added.set()
+
+    def entries(self) -> list:
+        entries = list()
+        for name in sorted(os.listdir(self.directory)):
+            if name.startswith('.'):
+                continue
+            try:
+                entries.append(SpooledUpload(f'{self.directory}/{name}'))
+            except (OSError, ValueError, KeyError) as e:
+                spool_log.error(f'Could not read spooled upload {name}: {type(e).__name__} {e}')
+                self._quarantine(f'{self.directory}/{name}')
+        return entries
+
+    def _quarantine(self, path: str):
+        os.makedirs(self.quarantine, exist_ok=True)
+        os.rename(path, f'{self.quarantine}/{os.path.basename(path)}')
+        spool_log.warning(f'Moved {path} to {self.quarantine}')
+
+    async def _drain(self):
+        while not self.drainer.try_acquire():
+            await asyncio.sleep(self.min_delay)
+        spool_log.info(f'Draining {self.directory}')
+        delay = self.min_delay
+        while True:
+            try:
+                delay = await self._drain_once(delay)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Never let one bad entry or a full disk stop the drainer for good
+                spool_log.exception(f'Draining {self.directory} failed, retrying in {delay}s')
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_delay)
+
+    async def _drain_once(self, delay: float) -> float:
+        """Replay everything in the spool once and return the delay to use next time."""
+        entries = self.entries()
+        if not entries:
+            self._added.clear()
+            try:
+                await asyncio.wait_for(self._added.wait(), self.min_delay)
+            except asyncio.TimeoutError:
+                # Other processes spool here too, so keep looking
+                return delay
+            # Whatever was just spooled failed against git a moment ago
+            await asyncio.sleep(delay)
+            return delay
+        spool_log.info(f'Replaying {len(entries)} spooled uploads')
+        results = await asyncio.gather(*(self.scheduler.submit(entry) for entry in entries),
+                                       return_exceptions=True)
+        failed = 0
+        for entry, result in zip(entries, results):
+            if isinstance(result, Exception):
+                failed += 1
+            # After a failed push the commit is local and goes out with the next push
+            elif result.stage in ('done', 'push'):
+                shutil.rmtree(entry.path)
+            elif result.stage == 'invalid':
+                self._quarantine(entry.path)
+            else:
+                failed += 1
+        if failed:
+            spool_log.warning(f'{failed} spooled uploads failed to replay, retrying in {delay}s')
+            await asyncio.sleep(delay)
+            return min(delay * 2, self.max_delay)
+        return self.min_delay
+
+    def close(self):
+        self.task.cancel()
+        self.drainer.release()
@@ -30,10 +30,16 @@ WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 from io import StringIO
 import sys
 import asyncio
+import logging
+from collections import defaultdict
+from time import perf_counter
 import discord
 from discord.ext.commands.formatter import Paginator
 import numpy as np
 
+utils_log = logging.getLogger('utils')
+max_git_processes = 4
+
 
 class Capturing(list):
     def __enter__(self):
@@ -101,31 +107,111 @@ def paginate(text, maxlen=1990):
     return paginator.pages
 
 
-async def run_command(args):
+class CommandResult:
+    """Exit code, output and run time of a finished subprocess. Truthy if it exited with 0."""
+    def __init__(self, args, returncode: int, stdout: str, stderr: str, duration: float):
+        self.args = args
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.duration = duration
+
+    @property
+    def output(self) -> str:
+        return '\n'.join(out for out in (self.stdout, self.stderr) if out)
+
+    def __bool__(self):
+        return self.returncode == 0
+
+    def __str__(self):
+        return self.output
+
+    def __repr__(self):
+        return f'<CommandResult args={self.args!r} returncode={self.returncode} duration={self.duration:.3f}>'
+
+
+# Caps how many git processes run at once across every cog
+git_semaphore = asyncio.Semaphore(max_git_processes)
+# Count, total and worst run time in seconds for each command, keyed by its first two arguments
+command_timings = defaultdict(lambda: [0, 0.0, 0.0])
+
+
+async def _communicate(process, timeout):
+    """Wait for a process, killing it if the timeout passes or the caller is cancelled."""
+    try:
+        return await asyncio.wait_for(process.communicate(), timeout)
+    except BaseException:
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+        await process.wait()
+        raise
+
+
+async def run_exec(*args, cwd=None, timeout: float=120) -> CommandResult:
+    """Run a command without a shell and return its exit code, stdout and stderr.
+
+    Raises asyncio.TimeoutError once the timeout passes, the child is killed first.
+    """
+    start = perf_counter()
+    process = await asyncio.create_subprocess_exec(*args, cwd=cwd,
+                                                   stdout=asyncio.subprocess.PIPE,
+                                                   stderr=asyncio.subprocess.PIPE)
+    stdout, stderr = await _communicate(process, timeout)
+    duration = perf_counter() - start
+    timing = command_timings[' '.join(args[:2])]
+    timing[0] += 1
+    timing[1] += duration
+    timing[2] = max(timing[2], duration)
+    utils_log.debug(f'{" ".join(args)} exited with {process.returncode} in {duration:.3f}s')
+    return CommandResult(args, process.returncode, stdout.decode().strip(), stderr.decode().strip(), duration)
+
+
+async def run_git(directory, *args, timeout: float=120) -> CommandResult:
+    async with git_semaphore:
+        return await run_exec('git', *args, cwd=directory, timeout=timeout)
+
+
+async def run_command(args, timeout: float=None):
     # Create subprocess
     process = await asyncio.create_subprocess_shell(
         args,
         # stdout must a pipe to be accessible as process.stdout
         stdout=asyncio.subprocess.PIPE)
-    # Wait for the subprocess to finish
-    stdout, stderr = await process.communicate()
+    # Wait for the subprocess to finish, it is killed if we time out or get cancelled
+    stdout, stderr = await _communicate(process, timeout)
     # Return stdout
     return stdout.decode().strip()
 
 
 async def git_add(loop, directory, file):
-    return await asyncio.wait_for(loop.create_task(run_command(f'(cd {directory} && git add {file})')), 120)
+    return await run_git(directory, 'add', '--', file)
+
+
+async def git_add_paths(loop, directory, paths, chunk_size=200):
+    """Stage only the given paths, relative to directory, so git never scans the rest of the tree."""
+    result = None
+    for i in range(0, len(paths), chunk_size):
+        result = await run_git(directory, 'update-index', '--add', '--', *paths[i:i + chunk_size])
+        if not result:
+            return result
+    return result
+
+
+async def git_has_staged(loop, directory) -> bool:
+    return not await run_git(directory, 'diff', '--cached', '--quiet')
 
 
 async def git_commit(loop, directory, message):
-    return await asyncio.wait_for(loop.create_task(run_command(f'(cd {directory} && git commit -m {message})')), 120)
+    return await run_git(directory, 'commit', '-m', message)
 
 
 async def git_push(loop, directory):
-    result = await asyncio.wait_for(loop.create_task(run_command(f'(cd {directory} && git push)')), 240)
-    return result if 'error: failed' in result else 'Completed'
+    result = await run_git(directory, 'push', timeout=240)
+    return 'Completed' if result else result.output
 
 
 async def git_pull(loop, directory):
-    result = await asyncio.wait_for(loop.create_task(run_command(f'(cd {directory} && git pull)')), 240)
-    return result if 'CONFLICT' in result else 'Completed'
+    result = await run_git(directory, 'pull', '--no-rebase', timeout=240)
+    return 'Completed' if result else result.output
@@ -0,0 +1,159 @@
+"""
+===
+
+MIT License
+
+Copyright (c) 2018 Dusty.P https://github.com/dustinpianalto
+
+Permission is hereby granted, free of charge, to any person obtaining
+a copy of this software and associated documentation files (the
+"Software"), to deal in the Software without restriction, including
+without limitation the rights to use, copy, modify, merge, publish,
+distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to
+the following conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+
+
+from discord.ext import commands
+import logging
+import re
+from .imports.utils import paginate
+from .imports.misc_classes import config_setup
+
+search_log = logging.getLogger('search')
+
+stat_names = {stat.lower().split()[0]: stat for stat in config_setup['Max Character Status Values']}
+stat_names.update({'hp': 'Health', 'stam': 'Stamina', 'torp': 'Torpidity', 'oxy': 'Oxygen',
+                   'speed': 'Movement Speed', 'dmg': 'Melee Damage', 'crafting': 'Crafting Skill'})
+filter_re = re.compile(r'^(?P<field>[a-z]+)(?P<op>>=|<=|=|>|<)(?P<value>.+)$')
+guid_re = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$')
+max_results = 100
+
+
+class InvalidFilter(commands.BadArgument):
+    pass
+
+
+def build_search(terms) -> (str, list):
+    """Turn search terms like ``rex female level>=300 melee>500 server=<guid>`` into a query.
+
+    Only the newest matching submission of each dino is returned.
+    """
+    where = list()
+    args = list()
+    species = list()
+
+    def arg(value):
+        args.append(value)
+        return f'${len(args)}'
+
+    for term in terms:
+        term = term.lower()
+        match = filter_re.match(term)
+        if term in ('male', 'female'):
+            where.append(f's.is_female = {arg(term == "female")}')
+        elif match is None:
+            species.append(term)
+        elif match.group('field') in ('level', 'lvl'):
+            try:
+                where.append(f's.level {match.group("op")} {arg(int(match.group("value")))}')
+            except ValueError:
+                raise InvalidFilter(f'{match.group("value")} is not a valid level.')
+        elif match.group('field') == 'server' and match.group('op') == '=':
+            if guid_re.match(match.group('value')) is None:
+                raise InvalidFilter(f'{match.group("value")} is not a valid server Guid.')
+            where.append(f's.server_guid = {arg(match.group("value"))}')
+        elif match.group('field') in stat_names:
+            try:
+                value = float(match.group('value'))
+            except ValueError:
+                raise InvalidFilter(f'{match.group("value")} is not a valid stat value.')
+            where.append(f'exists (select 1 from dino_stats st where st.upload_id = s.upload_id '
+                         f'and st.filename = s.filename and st.stat = {arg(stat_names[match.group("field")])} '
+                         f'and st.value {match.group("op")} {arg(value)})')
+        else:
+            raise InvalidFilter(f'{term} is not a valid filter.')
+    if species:
+        where.append(f'lower(s.species) = {arg(" ".join(species))}')
+    if not where:
+        raise InvalidFilter('Please give at least one filter.')
+    query = (f'select * from (select distinct on (s.dino_guid) s.dino_guid, s.species, s.tamed_name, s.level, '
+             f's.is_female, s.server_guid from dino_submissions s where {" and ".join(where)} '
+             f'order by s.dino_guid, s.submitted_at desc) latest '
+             f'order by level desc limit {max_results}')
+    return query, args
+
+
+class Search:
+    def __init__(self, bot):
+        self.bot = bot
+
+    @commands.command(aliases=['search'])
+    @commands.cooldown(1, 5, type=commands.BucketType.user)
+    async def find(self, ctx, *terms):
+        """Search every submitted dino.
+
+        Filters can be combined, for example:
+            find rex female level>=300 melee>500 server=<server guid>
+        Stats can be any of health, stamina, torpidity, oxygen, food, water,
+        temperature, weight, melee, movement, fortitude or crafting.
+        """
+        try:
+            query, args = build_search(terms)
+        except InvalidFilter as e:
+            await ctx.send(f'{ctx.author.mention} {e}')
+            return
+        rows = await self.bot.db_con.fetch(query, *args)
+        search_log.debug(f'{ctx.author.id} searched for {" ".join(terms)}, {len(rows)} results')
+        if not rows:
+            await ctx.send(f'{ctx.author.mention} No dinos matched your search.')
+            return
+        lines = [f'{row["species"]:<16} {row["tamed_name"][:24]:<24} Lvl {row["level"]:<4} '
+                 f'{"F" if row["is_female"] else "M"} {row["dino_guid"]}' for row in rows]
+        if len(rows) == max_results:
+            lines.append(f'Only the top {max_results} results are shown, narrow your search to see more.')
+        for page in paginate('\n'.join(lines)):
+            await ctx.send(page)
+
+    @commands.command()
+    @commands.cooldown(1, 5, type=commands.BucketType.user)
+    async def stats(self, ctx, dino_guid: str):
+        """Show the stats of a dino from its newest submission"""
+        dino_guid = dino_guid.lower()
+        if guid_re.match(dino_guid) is None:
+            await ctx.send(f'{ctx.author.mention} {dino_guid} is not a valid dino Guid.')
+            return
+        search_log.debug(f'{ctx.author.id} looked up {dino_guid}')
+        dino = await self.bot.db_con.fetchrow('select * from dino_submissions where dino_guid = $1 '
+                                              'order by submitted_at desc limit 1', dino_guid)
+        if dino is None:
+            await ctx.send(f'{ctx.author.mention} No dino found with the Guid {dino_guid}.')
+            return
+        stats = await self.bot.db_con.fetch('select stat, value from dino_stats '
+                                            'where upload_id = $1 and filename = $2',
+                                            dino['upload_id'], dino['filename'])
+        info = {'Species': dino['species'],
+                'Name': dino['tamed_name'],
+                'Level': dino['level'],
+                'Sex': 'Female' if dino['is_female'] else 'Male',
+                'Server': str(dino['server_guid']),
+                'Stats': {row['stat']: round(row['value'], 3) for row in stats}}
+        for page in paginate(info):
+            await ctx.send(page)
+
+
+def setup(bot):
+    bot.add_cog(Search(bot))
@@ -29,20 +29,177 @@ WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 import asyncio
 import discord
+from concurrent.futures.process import BrokenProcessPool
 from discord.ext import commands
-from io import BytesIO
-from .imports import process_files, utils
+from io import BytesIO, StringIO
+from .imports import dino_db, process_files
+from .imports.pipeline import UploadJob, UploadPipeline, UploadTooLarge
+from .imports.commit_scheduler import BatchResult, CommitScheduler
+from .imports.spool import UploadSpool
+from .imports.originals import OriginalsArchive
+from .imports.result_cache import ResultCache, UploadResult
+from .imports.maintenance import RepoMaintenance
 from configparser import ConfigParser
 import os
+import logging
+from hashlib import sha1
 from .imports.guid import Guid
 
+uploader_log = logging.getLogger('uploader')
 storage_dir = '../ASB_dino_submissions'
+spool_dir = 'submissions_temp/spool'
 owner_id = 351794468870946827
 
 
 class Uploader:
     def __init__(self, bot):
         self.bot = bot
+        self.scheduler = CommitScheduler(self.bot.loop, storage_dir,
+                                         window=self.bot.bot_config.get('commit_window', 10.0),
+                                         max_batch=self.bot.bot_config.get('commit_batch_size', 25),
+                                         fetch_interval=self.bot.bot_config.get('fetch_interval', 60.0))
+        self.originals = OriginalsArchive(storage_dir)
+        self.results = ResultCache(max_entries=self.bot.bot_config.get('result_cache_size', 256),
+                                   ttl=self.bot.bot_config.get('result_cache_ttl', 3600.0))
+        self.spool = UploadSpool(self.bot.loop, spool_dir, self.scheduler,
+                                 max_delay=self.bot.bot_config.get('spool_max_delay', 1800.0))
+        self.pipeline = UploadPipeline(self.bot.loop,
+                                       workers=self.bot.bot_config.get('upload_workers', 4),
+                                       queue_size=self.bot.bot_config.get('upload_queue_size', 50))
+        self.maintenance = RepoMaintenance(self.bot.loop, self.scheduler, self.pipeline,
+                                           interval=self.bot.bot_config.get('maintenance_interval', 21600.0),
+                                           idle_for=self.bot.bot_config.get('maintenance_idle', 300.0))
+
+    def __unload(self):
+        self.maintenance.close()
+        self.pipeline.close()
+        self.spool.close()
+        self.scheduler.close()
+
+    async def _download(self, job):
+        max_size = self.bot.bot_config.get('max_upload_size', 8388608)
+        if job.attachment.size > max_size:
+            raise UploadTooLarge(f'{job.attachment.filename} is larger than the {max_size // 1024}KB limit.')
+        job.file = BytesIO()
+        digest = sha1()
+        size = 0
+        async with self.bot.aio_session.get(job.attachment.url) as resp:
+            resp.raise_for_status()
+            async for chunk in resp.content.iter_chunked(65536):
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadTooLarge(f'{job.attachment.filename} is larger than the '
+                                         f'{max_size // 1024}KB limit.')
+                digest.update(chunk)
+                job.file.write(chunk)
+        job.digest = digest.hexdigest()
+        # Every complete download is archived, however the upload ends
+        job.originals = self.originals.stage(job.workspace, str(job.id), job.digest, job.file.getvalue(),
+                                             job.attachment.filename, job.ctx.author.id,
+                                             job.ctx.guild.id if job.ctx.guild else None,
+                                             job.ctx.message.created_at)
+        # Keyed on the options as given, before any prompt changes them, so a plain retry matches
+        job.cache_key = (job.digest, job.ctx.author.id, job.official, job.singleplayer)
+        job.cached = self.results.get(job.cache_key)
+
+    async def _keep_original(self, job):
+        """Commit the original zip of an upload that ended without persisting its files."""
+        try:
+            job.originals_only()
+            try:
+                result = await self.scheduler.submit(job)
+            except Exception as e:
+                uploader_log.exception(f'Commit of the original of {job} failed')
+                result = BatchResult([job], 'commit', f'{type(e).__name__} {e}'.strip())
+            if result.stage in ('pull', 'commit'):
+                self.spool.add(job)
+        except Exception:
+            uploader_log.exception(f'Could not archive the original of {job}')
+        finally:
+            job.cleanup()
+
+    async def _parse(self, job):
+        if job.cached is not None:
+            return
+        job.game_ini, job.dinos_data, job.mods, job.server_guid = \
+            await self.bot.run_in_process(process_files.process_zip, job.file.getvalue())
+
+    async def _render(self, job):
+        await job.msg.edit(content='Processing... Generating new files')
+        os.makedirs(job.workspace, exist_ok=True)
+        job.manifest.extend(await self.bot.loop.run_in_executor(self.bot.tpe, process_files.generate_files,
+                                                                job.workspace, job.ctx.author.id, job.server_guid,
+                                                                job.game_ini, job.dinos_data, job.mods,
+                                                                storage_dir))
+
+    async def _record(self, job):
+        # The files in the storage repo are the source of truth, nothing here may fail the upload
+        try:
+            records = await self.bot.run_in_process(dino_db.dino_records, str(job.id),
+                                                    job.ctx.author.id, str(job.server_guid),
+                                                    job.official == 'official', job.singleplayer,
+                                                    job.ctx.message.created_at, job.dinos_data)
+            await dino_db.store_dinos(self.bot.db_con, records)
+        except Exception:
+            uploader_log.exception(f'Could not store {job} in the database')
+
+    def _remember(self, job, message: str):
+        self.results.put(job.cache_key, UploadResult(message, f'{job.ctx.author.id}/{job.server_guid}'))
+
+    async def _notify_owner(self, content: str):
+        # The owner is only cached by the processes that share a guild with them, so fall back to the API
+        try:
+            owner = self.bot.get_user(owner_id) or await self.bot.get_user_info(owner_id)
+            await owner.send(content)
+        except Exception:
+            uploader_log.exception(f'Could not notify the owner: {content}')
+
+    async def _persist(self, job):
+        if not job.manifest:
+            # Everything in this upload is already stored, only its original is committed
+            await job.msg.delete()
+            job.msg = await job.ctx.send(f'{job.ctx.author.mention} Upload complete.\n'
+                                         f'All {len(job.dinos_data)} dinos were already up to date.')
+            self._remember(job, f'All {len(job.dinos_data)} dinos were already up to date.')
+            return
+        job.manifest.extend(job.originals)
+        job.persisted = True
+        await job.msg.edit(content='Processing... Files generated... Waiting to commit')
+        try:
+            result = await self.scheduler.submit(job)
+        except Exception as e:
+            # Never let the upload be cleaned up without being spooled
+            uploader_log.exception(f'Commit of {job} failed')
+            result = BatchResult([job], 'commit', f'{type(e).__name__} {e}'.strip())
+        if result.stage == 'done':
+            await job.msg.delete()
+            job.msg = await job.ctx.send(f'{job.ctx.author.mention} Upload complete.\n'
+                                         f'Uploaded {len(job.dinos_data)} dinos as {job.official} '
+                                         f'{"singleplayer" if job.singleplayer else "server"}')
+            self._remember(job, f'Uploaded {len(job.dinos_data)} dinos as {job.official} '
+                                f'{"singleplayer" if job.singleplayer else "server"}')
+            return
+        if result.stage in ('pull', 'commit'):
+            # Spool the upload first so it is committed automatically once git is healthy again
+            self.spool.add(job)
+            self._remember(job, f'{len(job.dinos_data)} dinos are waiting to be committed')
+        if job is result.jobs[0]:
+            # Only tell the owner once per failed batch
+            if result.stage == 'invalid':
+                await self._notify_owner(f'{job} could not be committed\n{result.status}')
+            else:
+                await self._notify_owner(f'There was an error with git {result.stage}\n{result.status}')
+        if result.stage in ('pull', 'commit'):
+            await job.msg.edit(content=f'Could not {"sync with" if result.stage == "pull" else "commit to"} '
+                                       f'GitHub.\n'
+                                       f'Your upload has been saved and will be committed automatically '
+                                       f'as soon as possible.')
+        elif result.stage == 'invalid':
+            await job.msg.edit(content='There was an error saving your files\n'
+                                       'Dusty.P has been notified and will get this fixed')
+        else:
+            await job.msg.edit(content='There was an error pushing the files to GitHub\n'
+                                       'Dusty.P has been notified and will get this fixed')
 
     @commands.command(name='upload', aliases=['submit'])
     async def upload_dino(self, ctx, official: str='unofficial', singleplayer: bool=False):
@@ -50,16 +207,25 @@ class Uploader:
         if ctx.message.attachments:
             attachment = ctx.message.attachments[0]
             if attachment.filename.endswith('.zip'):
-                async with ctx.typing():
-                    if not os.path.isdir(f'{storage_dir}/orig/'):
-                        os.mkdir(f'{storage_dir}/orig/')
-                    with open(f'{storage_dir}/orig/{attachment.filename.replace(".zip", "")}_'
-                              f'{ctx.message.created_at.strftime("%Y%m%dT%H%M%S")}.zip', 'wb') as file:
-                        await attachment.save(file)
-                    with BytesIO() as file:
-                        await attachment.save(file)
-                        unzipped = process_files.load_zip(file)
-                        game_ini, dinos_data, mods, server_guid = process_files.process_files(unzipped)
+                job = UploadJob(ctx, attachment, official, singleplayer)
+                try:
+                    async with ctx.typing():
+                        try:
+                            await self.pipeline.run(job, self._download, self._parse)
+                        except (UploadTooLarge, process_files.MemberTooLarge) as e:
+                            await msg.edit(content=f'{ctx.author.mention} {e}')
+                            return
+                        except (asyncio.TimeoutError, BrokenProcessPool):
+                            await msg.edit(content=f'{ctx.author.mention} Your files could not be processed in '
+                                                   f'time, please try again.')
+                            return
+                        if job.cached is not None:
+                            await msg.edit(content=f'{ctx.author.mention} This zip was already processed at '
+                                                   f'{job.cached.uploaded_at.strftime("%H:%M:%S")} UTC.\n'
+                                                   f'{job.cached.message}, stored in `{job.cached.location}`')
+                            return
+                        game_ini, dinos_data, mods, server_guid = (job.game_ini, job.dinos_data,
+                                                                   job.mods, job.server_guid)
                         if not game_ini and not dinos_data and not mods:
                             await msg.edit(content='There was an encoding error with one of the files provided '
                                                    'and they cannot be processed')
@@ -127,10 +293,10 @@ class Uploader:
                                             await asyncio.sleep(2)
                                             await msg.edit(content='Processing... Please Wait.')
                                             with BytesIO() as f:
-                                                game_msg.attachments[0].save(f)
-                                                game_ini = process_files.process_file(f, 'game.ini')
-                                                f.seek(0)
-                                                server_guid = process_files.get_server_guid(f.read())
+                                                await game_msg.attachments[0].save(f)
+                                                game_file = StringIO(process_files.decode_ini(f.getvalue()),
+                                                                     newline=None)
+                                            game_ini, _, server_guid = process_files.process_game_ini(game_file)
                                     elif str(reaction.emoji) == self.bot.unicode_emojis['x']:
                                         await msg.edit(content='Your request has been canceled.')
                                         return
@@ -185,41 +351,16 @@ class Uploader:
                                                        f'to default to "unofficial"')
                                 return
 
-                            await msg.edit(content='Processing... Syncing with GitHub')
-                            pull_status = await utils.git_pull(self.bot.loop, storage_dir)
-                            if pull_status == 'Completed':
-                                await msg.edit(content='Processing... Sync complete... Generating new files')
-                                process_files.generate_files(storage_dir, ctx, server_guid,
-                                                             game_ini, dinos_data, mods)
-                                await msg.edit(content='Processing... Files generated... Committing changes')
-                                await utils.git_add(self.bot.loop, storage_dir, '*')
-                                if await utils.git_commit(self.bot.loop,
-                                                          storage_dir,
-                                                          f'"Uploaded {len(dinos_data)} dinos {official}"'):
-                                    await msg.edit(content='Processing... Committed... Pushing files to GitHub')
-                                    push_status = await utils.git_push(self.bot.loop, storage_dir)
-                                    if push_status == 'Completed':
-                                        await msg.delete()
-                                        msg = await ctx.send(f'{ctx.author.mention} Upload complete.\n'
-                                                             f'Uploaded {len(dinos_data)} dinos as {official} '
-                                                             f'{"singleplayer" if singleplayer else "server"}')
-                                    else:
-                                        await self.bot.get_user(owner_id).send(f'There was an error with git push'
-                                                                               f'\n{push_status}')
-                                        await msg.edit(content='There was an error pushing the files to GitHub\n'
-                                                               'Dusty.P has been notified and will get this fixed')
-                                else:
-                                    await self.bot.get_user(owner_id).send(f'There was an error with git commit')
-                                    await msg.edit(content='There was an error committing the files\n'
-                                                           'Dusty.P has been notified and will get this fixed')
-                            else:
-                                await self.bot.get_user(owner_id).send(f'There was an error with git pull\n'
-                                                                       f'{pull_status}')
-                                process_files.generate_files('submissions_temp', ctx, server_guid,
-                                                             game_ini, dinos_data, mods)
-                                await msg.edit(content='Could not sync with GitHub.\n'
-                                                       'Dusty.P has been notified and your files are stored in a '
-                                                       'temporary location')
+                            job.msg = msg
+                            job.game_ini, job.server_guid = game_ini, server_guid
+                            job.official, job.singleplayer = official, singleplayer
+                            await self.pipeline.run(job, self._render, self._record)
+                            await self._persist(job)
+                finally:
+                    if job.persisted or not job.originals:
+                        job.cleanup()
+                    else:
+                        self.bot.loop.create_task(self._keep_original(job))
             else:
                 await msg.edit(content='Please attach a zip file to the command.')
         else:
@@ -50,8 +50,20 @@ class Utils:
         time = (msg.created_at - time1).total_seconds() * 1000
         em.description = f'Response Time: **{math.ceil(time)}ms**\n' \
                          f'Discord Latency: **{math.ceil(self.bot.latency*1000)}ms**'
+        if isinstance(self.bot, discord.AutoShardedClient):
+            guilds = self._shard_guilds()
+            em.description += f'\nThis guild is on shard **{ctx.guild.shard_id if ctx.guild else 0}**'
+            for shard_id, latency in self.bot.latencies:
+                em.add_field(name=f'Shard {shard_id}',
+                             value=f'{math.ceil(latency*1000)}ms, {guilds.get(shard_id, 0)} guilds')
         await msg.edit(embed=em)
 
+    def _shard_guilds(self) -> dict:
+        guilds = dict()
+        for guild in self.bot.guilds:
+            guilds[guild.shard_id] = guilds.get(guild.shard_id, 0) + 1
+        return guilds
+
     @commands.command(aliases=['oauth', 'link'])
     @commands.cooldown(1, 5, type=commands.BucketType.user)
     async def invite(self, ctx, guy: discord.User=None):
@@ -69,8 +81,16 @@ class Utils:
                        f'CPU Percentages: {psutil.cpu_percent(percpu=True)}\n'
                        f'Memory Usage: {psutil.virtual_memory().percent}%\n'
                        f'Disc Usage: {psutil.disk_usage("/").percent}%\n'
+                       f'{self._shard_info()}'
                        f'```')
 
+    def _shard_info(self) -> str:
+        if not isinstance(self.bot, discord.AutoShardedClient):
+            return f'Guilds: {len(self.bot.guilds)}\n'
+        guilds = self._shard_guilds()
+        return ''.join(f'Shard {shard_id}: {math.ceil(latency*1000)}ms latency, {guilds.get(shard_id, 0)} guilds\n'
+                       for shard_id, latency in self.bot.latencies)
+
 
 def setup(bot):
     bot.add_cog(Utils(bot))
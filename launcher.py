@@ -0,0 +1,158 @@
+"""
+===
+
+MIT License
+
+Copyright (c) 2018 Dusty.P https://github.com/dustinpianalto
+
+Permission is hereby granted, free of charge, to any person obtaining
+a copy of this software and associated documentation files (the
+"Software"), to deal in the Software without restriction, including
+without limitation the rights to use, copy, modify, merge, publish,
+distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to
+the following conditions:
+
+The above copyright notice and this permission notice shall be
+included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+
+import asyncio
+import json
+import logging
+import os
+import signal
+import sys
+import time
+from urllib.request import Request, urlopen
+from exts.imports.process_lock import FileLock
+
+log_format = '{asctime}.{msecs:03.0f}|{levelname:<8}|{name}::{message}'
+date_format = '%Y.%m.%d %H.%M.%S'
+
+logging.basicConfig(level=logging.INFO, style='{', datefmt=date_format, format=log_format)
+launcher_log = logging.getLogger('launcher')
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+config_dir = 'config/'
+bot_config_file = 'bot_config.json'
+secrets_file = 'bot_secrets.json'
+gateway_url = 'https://discordapp.com/api/v6/gateway/bot'
+
+# Restart delays, doubled after every crash and reset once a process has stayed up for stable_after seconds
+min_backoff = 1.0
+max_backoff = 60.0
+stable_after = 60.0
+
+
+def recommended_shards(token: str) -> int:
+    request = Request(gateway_url, headers={'Authorization': f'Bot {token}',
+                                            'User-Agent': 'ASB_submission_bot launcher'})
+    with urlopen(request, timeout=30) as resp:
+        return json.load(resp)['shards']
+
+
+def shard_ranges(shard_count: int, clusters: int) -> list:
+    """Split the shards into at most ``clusters`` contiguous ranges of near equal size."""
+    clusters = max(1, min(clusters, shard_count))
+    size, extra = divmod(shard_count, clusters)
+    ranges = list()
+    start = 0
+    for cluster in range(clusters):
+        end = start + size + (1 if cluster < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+class Cluster:
+    """One bot.py process running a range of shards, restarted with backoff whenever it crashes.
+
+    A clean exit (status 0) is taken as a shutdown and the cluster is not restarted,
+    the same as submitter_launcher.sh always did. ``restart`` stops the process
+    and starts it again straight away, which is how a reboot reaches every cluster.
+    """
+    def __init__(self, number: int, clusters: int, shard_ids: list, shard_count: int):
+        self.number = number
+        self.clusters = clusters
+        self.shard_ids = shard_ids
+        self.shard_count = shard_count
+        self.process = None
+        self.backoff = min_backoff
+        self.stopping = False
+        self.restarting = False
+
+    async def run(self):
+        env = dict(os.environ,
+                   SUBMITTER_CLUSTER=str(self.number),
+                   SUBMITTER_CLUSTERS=str(self.clusters),
+                   SUBMITTER_SHARD_IDS=','.join(str(shard_id) for shard_id in self.shard_ids),
+                   SUBMITTER_SHARD_COUNT=str(self.shard_count))
+        while not self.stopping:
+            started = time.monotonic()
+            launcher_log.info(f'Starting cluster {self.number} with shards {self.shard_ids}')
+            self.process = await asyncio.create_subprocess_exec(sys.executable, 'bot.py', cwd=base_dir, env=env)
+            returncode = await self.process.wait()
+            if self.restarting and not self.stopping:
+                launcher_log.info(f'Cluster {self.number} stopped for a reboot')
+                self.restarting = False
+                self.backoff = min_backoff
+                continue
+            if self.stopping or returncode == 0:
+                launcher_log.info(f'Cluster {self.number} shut down')
+                return
+            if time.monotonic() - started >= stable_after:
+                self.backoff = min_backoff
+            launcher_log.warning(f'Cluster {self.number} exited with {returncode}, '
+                                 f'restarting in {self.backoff:.0f}s')
+            await asyncio.sleep(self.backoff)
+            self.backoff = min(self.backoff * 2, max_backoff)
+
+    def restart(self):
+        # A cluster waiting out its backoff starts on the new code anyway
+        if self.process is not None and self.process.returncode is None:
+            self.restarting = True
+            self.process.terminate()
+
+    def stop(self):
+        self.stopping = True
+        if self.process is not None and self.process.returncode is None:
+            self.process.terminate()
+
+
+async def main():
+    with open(f'{base_dir}/{config_dir}{bot_config_file}') as file:
+        bot_config = json.load(file)
+    shard_count = bot_config.get('shard_count')
+    if shard_count is None:
+        with open(f'{base_dir}/{config_dir}{secrets_file}') as file:
+            shard_count = recommended_shards(json.load(file)['token'])
+    processes = bot_config.get('cluster_processes') or os.cpu_count() or 1
+    ranges = shard_ranges(shard_count, processes)
+    clusters = [Cluster(number, len(ranges), shard_ids, shard_count) for number, shard_ids in enumerate(ranges)]
+    launcher_log.info(f'Running {shard_count} shards in {len(clusters)} processes')
+
+    loop = asyncio.get_event_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, lambda: [cluster.stop() for cluster in clusters])
+    # Sent by the reboot command, so every cluster picks up new code and not just the one that got the command
+    loop.add_signal_handler(signal.SIGHUP, lambda: [cluster.restart() for cluster in clusters])
+    await asyncio.gather(*(cluster.run() for cluster in clusters))
+
+
+if __name__ == '__main__':
+    # One launcher per checkout, a second one would double every shard
+    launcher_lock = FileLock(f'{base_dir}/{config_dir}launcher.lock')
+    if not launcher_lock.try_acquire():
+        launcher_log.error('Another launcher is already running from this directory')
+        sys.exit(1)
+    asyncio.get_event_loop().run_until_complete(main())
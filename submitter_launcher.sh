@@ -1,6 +1,7 @@
 #!/bin/bash
 
-until python /home/dusty/bin/ASB_submission_bot/bot.py; do
-	echo "Submitter shutdown with error: $?. Restarting..." >&2
+# launcher.py starts and supervises one bot.py per shard range, this only restarts the launcher itself
+until python /home/dusty/bin/ASB_submission_bot/launcher.py; do
+	echo "Submitter launcher shutdown with error: $?. Restarting..." >&2
 	sleep 1
-done
\ No newline at end of file
+done